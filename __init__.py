@@ -10,37 +10,69 @@ bl_info = {
 }
 
 first_startup = "bpy" not in locals()
-import bpy
+try:
+    import bpy
+except ImportError:
+    # Outside of Blender only the bpy-free modules (asset_index, benchmark, bin_ops, catalog, conversion, document, inspector, instrumentation, logger, memory, parser, scene_files, scene_generator) can be used
+    bpy = None
 import sys
 
-from . import bin_ops
-from . import core
-from . import import_handler
-from . import operators
-from . import panels
-from . import properties
-from . import utils
-
-if not first_startup:
-    import importlib
-    importlib.reload(bin_ops)
-    importlib.reload(core)
-    importlib.reload(import_handler)
-    importlib.reload(operators)
-    importlib.reload(panels)
-    importlib.reload(properties)
-    importlib.reload(utils)
-
-
-classes = [
-    panels.MainPanel,
-
-    operators.ImportXPSButton,
-    operators.ImportXPSTestButton,
-    operators.SelectInstallDirButton,
-    operators.SelectAssetDirButton,
+# Modules in reload order. Only the ones needed to register the addon are imported here,
+# the others (parser, pose, import_handler, ...) load numpy and are imported when they are first used
+module_names = [
+    "logger",
+    "memory",
+    "asset_index",
+    "bin_ops",
+    "instrumentation",
+    "transaction",
+    "document",
+    "parser",
+    "scene_generator",
+    "conversion",
+    "pose",
+    "animation",
+    "utils",
+    "model_cache",
+    "core",
+    "import_handler",
+    "operators",
+    "panels",
+    "properties",
 ]
 
+if bpy is not None:
+    import time
+    from . import core
+    from . import logger
+    from . import operators
+    from . import panels
+    from . import properties
+
+    if not first_startup:
+        import importlib
+        for module_name in module_names:
+            module = sys.modules.get(f"{__name__}.{module_name}")
+            if module is not None:
+                importlib.reload(module)
+
+    log = logger.get_logger("addon")
+
+    classes = [
+        panels.MainPanel,
+
+        operators.ImportXPSButton,
+        operators.ImportXPSSequenceButton,
+        operators.ImportPoseButton,
+        operators.LoadPlaceholdersButton,
+        operators.LiveSyncButton,
+        operators.ImportXPSTestButton,
+        operators.SelectInstallDirButton,
+        operators.SelectAssetDirButton,
+        operators.RebuildAssetIndexButton,
+        operators.ClearModelCacheButton,
+    ]
+
 
 def check_unsupported_blender_versions():
     version = (3, 3)
@@ -56,7 +88,7 @@ def check_unsupported_blender_versions():
 
 
 def register():
-    print("\n#### Loading XPS/XNALara Scene Importer.. ####")
+    start = time.perf_counter()
 
     # Check if Blender version is supported
     check_unsupported_blender_versions()
@@ -73,12 +105,18 @@ def register():
     # Load settings
     core.SettingsHandler.init()
 
-    print("#### Loaded XPS/XNALara Scene Importer ####\n")
+    # Load hidden models once their placeholders get unhidden
+    core.PlaceholderHandler.init()
+
+    log.info("Loaded XPS/XNALara Scene Importer in %.1f ms", (time.perf_counter() - start) * 1000)
 
 
 def unregister():
     print("#### Unloading XPS/XNALara Scene Importer.. ####")
 
+    core.PlaceholderHandler.unregister()
+    core.SceneWatcher.stop()
+
     for cls in reversed(classes):
         try:
             bpy.utils.unregister_class(cls)
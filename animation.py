@@ -0,0 +1,104 @@
+import bpy
+import numpy as np
+
+from . import instrumentation
+from .pose import PoseApplier, use_quaternion_rotation
+
+# Keyframes of XPS scene sequences and pose folders. Every fcurve gets all of its keyframes at once via keyframe_points.add and foreach_set,
+# which is a lot faster than inserting the keyframes one by one with keyframe_insert.
+
+REST_ROTATION = np.array((1, 0, 0, 0), dtype=np.float64)
+REST_LOCATION = np.zeros(3, dtype=np.float64)
+REST_SCALE = np.ones(3, dtype=np.float64)
+
+
+def add_fcurves(action, data_path, frames, values, group=None):
+    # Adds one fcurve per channel of the (F, C) values array, with one keyframe per frame
+    co = np.empty((len(frames), 2), dtype=np.float32)
+    co[:, 0] = frames
+    for index in range(values.shape[1]):
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group or "")
+        fcurve.keyframe_points.add(len(frames))
+        co[:, 1] = values[:, index]
+        fcurve.keyframe_points.foreach_set("co", co.ravel())
+        fcurve.update()
+    instrumentation.current.count("fcurves", values.shape[1])
+    instrumentation.current.count("keyframes", values.shape[1] * len(frames))
+
+
+class ArmatureAnimation:
+    # Collects the pose and transformation of an armature for every frame of a sequence and writes them into one Action.
+    # Frames in which the item is missing keep the values of the frame before
+
+    def __init__(self, armature, applier: PoseApplier, frame_count):
+        self.armature = armature
+        self.applier = applier
+
+        bone_count = applier.bone_count
+        self.rotations = np.empty((frame_count, bone_count, 4), dtype=np.float64)
+        self.locations = np.empty((frame_count, bone_count, 3), dtype=np.float64)
+        self.scales = np.empty((frame_count, bone_count, 3), dtype=np.float64)
+        self.object_locations = np.empty((frame_count, 3), dtype=np.float64)
+        self.object_scales = np.empty((frame_count, 3), dtype=np.float64)
+        self.has_frame = np.zeros(frame_count, dtype=bool)
+        self.has_object_transforms = False
+
+    def set_frame(self, frame_index, bones, location=None, scale=None):
+        # The poses are computed relative to the rest pose, like in a new import.
+        # Location and scale of the armature object are optional and have to be converted to Blender space already
+        rotations, locations, scales, _, _ = self.applier.get_pose(bones, from_rest=True)
+        self.rotations[frame_index] = rotations
+        self.locations[frame_index] = locations
+        self.scales[frame_index] = scales
+        if location is not None:
+            self.object_locations[frame_index] = location
+            self.object_scales[frame_index] = scale
+            self.has_object_transforms = True
+        self.has_frame[frame_index] = True
+
+    def _fill_missing_frames(self):
+        # Use the last frame that contains the item, or the first one for frames before it
+        indices = np.where(self.has_frame, np.arange(len(self.has_frame)), 0)
+        indices = np.maximum.accumulate(indices)
+        indices[:np.argmax(self.has_frame)] = np.argmax(self.has_frame)
+        for values in (self.rotations, self.locations, self.scales, self.object_locations, self.object_scales):
+            values[:] = values[indices]
+
+    def _make_rotations_continuous(self):
+        # q and -q are the same rotation, but interpolating between them spins the bone by 360°.
+        # Flip every quaternion that points into the other hemisphere than the one of the frame before
+        dots = (self.rotations[1:] * self.rotations[:-1]).sum(axis=-1)
+        signs = np.cumprod(np.where(dots < 0, -1.0, 1.0), axis=0)
+        self.rotations[1:] *= signs[..., np.newaxis]
+
+    def write(self, frames, name, assign=True, skip_rest=True):
+        # Writes the collected frames into a new Action and assigns it to the armature.
+        # With skip_rest, bone channels that stay in the rest pose during the whole sequence are skipped
+        if not self.has_frame.any():
+            return None
+        self._fill_missing_frames()
+        self._make_rotations_continuous()
+
+        # The rotations are keyed as quaternions, so the bones have to use them. The rig might have been changed since the applier was created
+        use_quaternion_rotation(self.armature)
+
+        action = bpy.data.actions.new(name)
+        if assign:
+            animation_data = self.armature.animation_data or self.armature.animation_data_create()
+            animation_data.action = action
+
+        frames = np.asarray(frames, dtype=np.float32)
+        if self.has_object_transforms:
+            add_fcurves(action, "location", frames, self.object_locations, group="Object Transforms")
+            add_fcurves(action, "scale", frames, self.object_scales, group="Object Transforms")
+
+        for i, bone in enumerate(self.armature.pose.bones):
+            path = f'pose.bones["{bpy.utils.escape_identifier(bone.name)}"]'
+            for prop, values, rest in (("rotation_quaternion", self.rotations[:, i], REST_ROTATION),
+                                       ("location", self.locations[:, i], REST_LOCATION),
+                                       ("scale", self.scales[:, i], REST_SCALE)):
+                if skip_rest and (values == rest).all():
+                    continue
+                add_fcurves(action, f"{path}.{prop}", frames, values, group=bone.name)
+
+        return action
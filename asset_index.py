@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import pathlib
+
+from . import logger
+
+log = logger.get_logger("asset_index")
+MESH_SUFFIXES = (".mesh", ".xps", ".ascii")
+
+
+class AssetIndex:
+    # On-disk index of the asset directory. Maps folder names and lower-cased mesh stems to their paths,
+    # so missing models can be found without walking the whole asset directory on every import.
+    # Directories are only listed again when their mtime changed.
+    version = 1
+
+    def __init__(self, root: pathlib.Path, index_file: pathlib.Path, max_depth=5):
+        self.root = pathlib.Path(root)
+        self.index_file = pathlib.Path(index_file)
+        self.max_depth = max_depth
+
+        # Directory path -> {"mtime": float, "subdirs": [names], "meshes": [file names]}
+        self.dirs = {}
+
+        # Lookup tables, built from self.dirs
+        self.folders = {}  # Folder name -> [folder paths]
+        self.meshes = {}  # Lower-cased mesh stem -> [file paths]
+        self.dir_meshes = {}  # Folder path -> {lower-cased mesh stem: file name}
+
+        self.last_refresh = 0
+
+    def load(self):
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            log.warning("Could not read asset index '%s', it will be rebuilt.", self.index_file)
+            return
+        if data.get("version") != self.version or data.get("root") != str(self.root) or data.get("max_depth") != self.max_depth:
+            return
+        self.dirs = data.get("dirs", {})
+        self._build_lookups()
+
+    def save(self):
+        data = {
+            "version": self.version,
+            "root": str(self.root),
+            "max_depth": self.max_depth,
+            "dirs": self.dirs,
+        }
+        tmp_file = self.index_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.index_file)
+
+    def rebuild(self):
+        self.dirs = {}
+        self.refresh()
+
+    def refresh(self):
+        # Walk the known directory tree, but only list directories whose mtime changed since the last refresh
+        start = time.time()
+        dirs_new = {}
+        listed_count = 0
+
+        stack = [(str(self.root), 0)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+
+            entry = self.dirs.get(path)
+            if not entry or entry["mtime"] != mtime:
+                entry = self._list_dir(path, mtime)
+                listed_count += 1
+            dirs_new[path] = entry
+
+            if depth < self.max_depth:
+                for name in entry["subdirs"]:
+                    stack.append((os.path.join(path, name), depth + 1))
+
+        changed = listed_count > 0 or len(dirs_new) != len(self.dirs)
+        self.dirs = dirs_new
+        self.last_refresh = time.time()
+        if changed:
+            self._build_lookups()
+            self.save()
+        log.info("Refreshed asset index of '%s' in %.2fs (%s folders, %s listed)", self.root, time.time() - start, len(self.dirs), listed_count)
+
+    def _list_dir(self, path, mtime):
+        subdirs = []
+        meshes = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(entry.name)
+                        elif os.path.splitext(entry.name)[1] in MESH_SUFFIXES:
+                            meshes.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return {"mtime": mtime, "subdirs": subdirs, "meshes": meshes}
+
+    def _build_lookups(self):
+        # Build new tables and swap them in at once, so concurrent lookups never see half-built tables
+        folders = {}
+        meshes = {}
+        dir_meshes = {}
+        for path, entry in self.dirs.items():
+            folder = pathlib.Path(path)
+            folders.setdefault(folder.name, []).append(folder)
+
+            stems = {}
+            for file_name in entry["meshes"]:
+                stem = os.path.splitext(file_name)[0].lower()
+                stems.setdefault(stem, file_name)
+                meshes.setdefault(stem, []).append(folder / file_name)
+            dir_meshes[path] = stems
+
+        self.folders, self.meshes, self.dir_meshes = folders, meshes, dir_meshes
+
+    def find_folders(self, folder_name: str):
+        return self.folders.get(folder_name, [])
+
+    def find_mesh_files(self, file_name: str):
+        return self.meshes.get(file_name.lower(), [])
+
+    def find_mesh_in_folder(self, folder: pathlib.Path, file_name: str):
+        file = self.dir_meshes.get(str(folder), {}).get(file_name.lower())
+        if file:
+            return folder / file
+        return None
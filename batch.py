@@ -0,0 +1,317 @@
+# Headless batch conversion of .scene files to .blend files.
+#
+# Usage (outside of Blender):
+#   python batch.py <scene dirs, files or glob patterns> [--output DIR] [--jobs N] [--blender PATH]
+#
+# The scenes are distributed to N background Blender processes. Each worker enables this addon and the XPS importer
+# once and then converts one scene after another, so the startup cost is only paid once per worker.
+# This file is also the worker script that runs inside of Blender, so it must only use the standard library at module level.
+
+import os
+import sys
+import json
+import time
+import queue
+import pathlib
+import argparse
+import importlib
+import threading
+import subprocess
+from collections import deque
+
+RESULT_PREFIX = "XPS_BATCH_RESULT "
+addon_dir = pathlib.Path(__file__).resolve().parent
+
+
+# Worker, runs inside of Blender
+
+def _send(data):
+    sys.stdout.write(RESULT_PREFIX + json.dumps(data) + "\n")
+    sys.stdout.flush()
+
+
+def run_worker(addon_module):
+    import bpy
+    import addon_utils
+
+    start = time.perf_counter()
+
+    # Make the addon importable even if it isn't installed in Blender
+    if str(addon_dir.parent) not in sys.path:
+        sys.path.insert(0, str(addon_dir.parent))
+    addon_utils.enable(addon_module, default_set=True)
+    import_handler = importlib.import_module(f"{addon_module}.import_handler")
+
+    _send({"ready": True, "startup_time": time.perf_counter() - start})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        _send(convert_scene(bpy, import_handler, job))
+
+
+def convert_scene(bpy, import_handler, job):
+    start = time.perf_counter()
+    result = {
+        "scene": job["scene"],
+        "output": job["output"],
+        "success": False,
+        "errors": [],
+    }
+
+    try:
+        # Start every scene from an empty file
+        bpy.ops.wm.read_homefile(use_empty=True)
+        if job.get("install_dir"):
+            bpy.context.scene.xps_importer_install_dir = job["install_dir"]
+        if job.get("asset_dir"):
+            bpy.context.scene.xps_importer_asset_dir = job["asset_dir"]
+
+        import_start = time.perf_counter()
+        importer = import_handler.ImportXPS(job["scene"], **job["options"])
+        result["import_time"] = time.perf_counter() - import_start
+        result["errors"] = list(importer.error_handler.errors)
+        if importer.memory_report:
+            result["memory"] = importer.memory_report
+
+        save_start = time.perf_counter()
+        pathlib.Path(job["output"]).parent.mkdir(parents=True, exist_ok=True)
+        bpy.ops.wm.save_as_mainfile(filepath=job["output"], check_existing=False, compress=job.get("compress", False))
+        result["save_time"] = time.perf_counter() - save_start
+
+        result["success"] = True
+    except Exception as e:
+        result["errors"].append(f"{type(e).__name__}: {e}")
+
+    result["total_time"] = time.perf_counter() - start
+    return result
+
+
+# Controller, runs outside of Blender
+
+class Worker:
+    def __init__(self, blender, addon_module, index):
+        self.blender = blender
+        self.addon_module = addon_module
+        self.index = index
+        self.process: subprocess.Popen = None
+        self.startup_time = 0
+        self.log = deque(maxlen=50)  # Last lines of Blender output, attached to failed conversions
+
+    def start(self):
+        command = [self.blender, "-b", "--python", str(pathlib.Path(__file__).resolve()), "--", "--worker", "--addon-module", self.addon_module]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, encoding="utf-8", errors="replace", bufsize=1)
+        ready = self._receive()
+        if not ready:
+            raise RuntimeError(f"Blender worker {self.index} failed to start:\n" + "\n".join(self.log))
+        self.startup_time = ready.get("startup_time", 0)
+
+    def stop(self):
+        if not self.process:
+            return
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def _receive(self):
+        # Skip all the regular Blender output until the next result line
+        for line in self.process.stdout:
+            if line.startswith(RESULT_PREFIX):
+                return json.loads(line[len(RESULT_PREFIX):])
+            self.log.append(line.rstrip())
+        return None
+
+    def convert(self, job):
+        if not self.process or self.process.poll() is not None:
+            self.start()
+
+        self.log.clear()
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+
+        result = self._receive()
+        if result is None:
+            # Blender crashed, a new worker process gets started for the next scene
+            self.stop()
+            result = {
+                "scene": job["scene"],
+                "output": job["output"],
+                "success": False,
+                "errors": ["Blender worker exited unexpectedly:\n" + "\n".join(self.log)],
+            }
+        result["worker"] = self.index
+        return result
+
+
+def collect_scene_files(inputs):
+    # This file also runs as a plain script, so the shared module is imported through the addon package
+    if str(addon_dir.parent) not in sys.path:
+        sys.path.insert(0, str(addon_dir.parent))
+    scene_files = importlib.import_module(f"{addon_dir.name}.scene_files")
+    return scene_files.collect_scene_files(inputs)
+
+
+def get_output_files(scene_files, output_dir):
+    outputs = []
+    used = set()
+    for scene_file in scene_files:
+        if not output_dir:
+            outputs.append(scene_file.with_suffix(".blend"))
+            continue
+
+        # Scenes from different folders can share the same name
+        output = pathlib.Path(output_dir) / f"{scene_file.stem}.blend"
+        i = 2
+        while output in used:
+            output = pathlib.Path(output_dir) / f"{scene_file.stem}_{i}.blend"
+            i += 1
+        used.add(output)
+        outputs.append(output)
+    return outputs
+
+
+def run_batch(scene_files, output_files, blender="blender", jobs=1, options=None, install_dir=None, asset_dir=None, compress=False):
+    jobs_queue = queue.Queue()
+    for scene_file, output_file in zip(scene_files, output_files):
+        jobs_queue.put({
+            "scene": str(scene_file),
+            "output": str(output_file),
+            "options": options or {},
+            "install_dir": install_dir,
+            "asset_dir": asset_dir,
+            "compress": compress,
+        })
+
+    results = []
+    results_lock = threading.Lock()
+    total = len(scene_files)
+    addon_module = addon_dir.name
+
+    def work(index):
+        worker = Worker(blender, addon_module, index)
+        try:
+            while True:
+                try:
+                    job = jobs_queue.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result = worker.convert(job)
+                except (OSError, RuntimeError) as e:
+                    result = {"scene": job["scene"], "output": job["output"], "success": False, "errors": [str(e)], "worker": index}
+
+                with results_lock:
+                    results.append(result)
+                    status = "OK  " if result["success"] and not result["errors"] else "WARN" if result["success"] else "FAIL"
+                    print(f"[{len(results)}/{total}] {status} {result.get('total_time', 0):6.1f}s  {job['scene']}")
+        finally:
+            worker.stop()
+
+    threads = [threading.Thread(target=work, args=[i]) for i in range(max(1, min(jobs, total)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Keep the input order in the summary
+    order = {str(f): i for i, f in enumerate(scene_files)}
+    results.sort(key=lambda r: order.get(r["scene"], 0))
+    return results
+
+
+def print_summary(results, wall_time):
+    converted = [r for r in results if r["success"]]
+    failed = [r for r in results if not r["success"]]
+    with_errors = [r for r in converted if r["errors"]]
+
+    print("\n#### Batch conversion summary ####")
+    print(f"Scenes: {len(results)}, converted: {len(converted)} ({len(with_errors)} with errors), failed: {len(failed)}")
+    print(f"Wall time: {wall_time:.1f}s")
+    if converted:
+        import_times = [r.get("import_time", 0) for r in converted]
+        save_times = [r.get("save_time", 0) for r in converted]
+        print(f"Import time: total {sum(import_times):.1f}s, average {sum(import_times) / len(import_times):.2f}s, max {max(import_times):.2f}s")
+        print(f"Save time: total {sum(save_times):.1f}s, average {sum(save_times) / len(save_times):.2f}s")
+
+    for result in results:
+        if not result["errors"]:
+            continue
+        print(f"\n{'Failed' if not result['success'] else 'Errors in'} {result['scene']}:")
+        for error in result["errors"]:
+            print(f"- {error}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Blender passes the worker arguments after "--"
+    if "--worker" in argv:
+        argv = argv[argv.index("--worker"):]
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--worker", action="store_true")
+        parser.add_argument("--addon-module", default=addon_dir.name)
+        args = parser.parse_args(argv)
+        run_worker(args.addon_module)
+        return 0
+
+    parser = argparse.ArgumentParser(description="Converts XPS .scene files to .blend files using background Blender processes.")
+    parser.add_argument("inputs", nargs="+", help="Scene files, folders containing scene files or glob patterns")
+    parser.add_argument("-o", "--output", help="Output folder for the .blend files. By default they are saved next to the scene files")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Number of Blender worker processes")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Path to the Blender executable")
+    parser.add_argument("--install-dir", help="XNALara installation folder")
+    parser.add_argument("--asset-dir", help="XPS asset folder")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip scenes whose .blend file is newer than the scene file")
+    parser.add_argument("--compress", action="store_true", help="Save compressed .blend files")
+    parser.add_argument("--report", help="Write the results of all scenes to this JSON file")
+    parser.add_argument("--no-models", action="store_true", help="Don't import models")
+    parser.add_argument("--no-lights", action="store_true", help="Don't import lights")
+    parser.add_argument("--no-camera", action="store_true", help="Don't import the camera")
+    parser.add_argument("--no-ground", action="store_true", help="Don't import the ground")
+    parser.add_argument("--include-hidden", action="store_true", help="Also import models that are hidden in the scene")
+    parser.add_argument("--no-model-cache", action="store_true", help="Don't use the model cache, always import models with the XPS importer")
+    parser.add_argument("--low-memory", action="store_true", help="Delete unused data created during each import and report the memory use")
+    parser.add_argument("--hidden-placeholders", action="store_true", help="Add placeholders for hidden models, which import the model once they get unhidden")
+    args = parser.parse_args(argv)
+
+    scene_files = collect_scene_files(args.inputs)
+    output_files = get_output_files(scene_files, args.output)
+    if args.skip_existing:
+        pairs = [(s, o) for s, o in zip(scene_files, output_files) if not o.exists() or o.stat().st_mtime < s.stat().st_mtime]
+        scene_files, output_files = [p[0] for p in pairs], [p[1] for p in pairs]
+    if not scene_files:
+        print("No scene files to convert.")
+        return 0
+
+    options = {
+        "import_models": not args.no_models,
+        "import_lights": not args.no_lights,
+        "import_camera": not args.no_camera,
+        "import_ground": not args.no_ground,
+        "hidden_models": "IMPORT" if args.include_hidden else "PLACEHOLDER" if args.hidden_placeholders else "EXCLUDE",
+        "use_model_cache": not args.no_model_cache,
+        "low_memory": args.low_memory,
+    }
+
+    print(f"Converting {len(scene_files)} scenes with {min(args.jobs, len(scene_files))} Blender workers..")
+    start = time.perf_counter()
+    results = run_batch(scene_files, output_files, blender=args.blender, jobs=args.jobs, options=options,
+                        install_dir=args.install_dir, asset_dir=args.asset_dir, compress=args.compress)
+    wall_time = time.perf_counter() - start
+    print_summary(results, wall_time)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"wall_time": wall_time, "results": results}, f, indent=4)
+
+    return 0 if all(r["success"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
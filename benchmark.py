@@ -0,0 +1,206 @@
+# Parser throughput benchmark, runs without Blender on generated scenes.
+#
+# Usage (from the folder containing the addon folder):
+#   python -m <addon folder>.benchmark [--repeats N] [--cases small large ...] [--json results.json] [--compare baseline.json]
+#
+# Every case generates a scene with scene_generator, checks once that it parses correctly,
+# and then reports the best parse time as items/s, bones/s and MB/s.
+# With --compare the results are checked against an earlier --json output, so parser regressions fail the run.
+#
+# With --blender the addon startup is measured instead: a background Blender enables the addon and reports how long
+# importing and registering it took, and whether that imported numpy. The run fails above STARTUP_TARGET.
+
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+from . import logger
+from . import parser
+from . import scene_generator
+
+CASES = {
+    "small": dict(item_count=10, bone_count=100),
+    "medium": dict(item_count=100, bone_count=200, accessory_count=4),
+    "large": dict(item_count=500, bone_count=250, accessory_count=4, secondary_accessory_count=2),
+    "long strings": dict(item_count=100, bone_count=200, string_length=200),
+    "newest version": dict(version=(1, 30), item_count=100, bone_count=200),
+}
+
+# Enabling the addon must not take longer than this, numpy alone takes about 100 ms to import
+STARTUP_TARGET = 0.05
+STARTUP_PREFIX = "XPS_STARTUP_RESULT "
+STARTUP_SCRIPT = """
+import sys, json, time, addon_utils
+sys.path.insert(0, {addon_parent!r})
+numpy_loaded = "numpy" in sys.modules
+start = time.perf_counter()
+addon_utils.enable({addon_module!r}, default_set=True)
+startup_time = time.perf_counter() - start
+print({prefix!r} + json.dumps({{"startup_time": startup_time, "numpy_imported": not numpy_loaded and "numpy" in sys.modules}}))
+"""
+
+
+def check_invalid_string(directory: Path):
+    # A scene with invalid UTF-8 in an item name has to fail with a ValueError, and the parser must not keep the file open
+    filepath = directory / "invalid_string.scene"
+    data = scene_generator.write_document(scene_generator.create_document(item_count=3, bone_count=10))
+    filepath.write_bytes(data.replace(b"generic_item", b"\xffeneric_item", 1))
+
+    scene_parser = parser.SceneParser(filepath)
+    try:
+        scene_parser.parse()
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Scene with an invalid string was parsed without an error")
+    if scene_parser.reader._file is not None or scene_parser.reader._mmap is not None:
+        raise ValueError("Scene with an invalid string was not closed after the error")
+
+
+def run_case(directory: Path, name, settings, repeats):
+    filepath = directory / f"{name.replace(' ', '_')}.scene"
+    expected = scene_generator.write_scene(filepath, **settings)
+
+    # Make sure the generated scene is actually parsed correctly before measuring it
+    errors = scene_generator.compare_documents(expected, parser.parse_scene(filepath))
+    if errors:
+        raise ValueError(f"Generated scene '{name}' was not parsed correctly:\n" + "\n".join(errors[:10]))
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parser.parse_scene(filepath)
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+    item_count = len(expected.items)
+    bone_count = sum(len(item.bones) for item in expected.items)
+    size = filepath.stat().st_size
+    return {
+        "case": name,
+        "settings": {key: list(value) if isinstance(value, tuple) else value for key, value in settings.items()},
+        "items": item_count,
+        "bones": bone_count,
+        "bytes": size,
+        "best_time": best,
+        "median_time": statistics.median(times),
+        "items_per_s": item_count / best,
+        "bones_per_s": bone_count / best,
+        "mb_per_s": size / best / 1024 / 1024,
+    }
+
+
+def run_benchmark(cases, repeats=5):
+    # The parser only logs at the info level per phase, but keep the console quiet while measuring
+    log_level = logger.get_level()
+    logger.set_level(logging.WARNING)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            check_invalid_string(Path(directory))
+            return [run_case(Path(directory), name, settings, repeats) for name, settings in cases.items()]
+    finally:
+        logger.set_level(log_level)
+
+
+def run_startup_benchmark(blender, repeats=5):
+    # Starts a fresh background Blender per repeat, since the addon is only imported once per process
+    addon_dir = Path(__file__).resolve().parent
+    script = STARTUP_SCRIPT.format(addon_parent=str(addon_dir.parent), addon_module=__package__, prefix=STARTUP_PREFIX)
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([blender, "--background", "--factory-startup", "--python-expr", script],
+                                capture_output=True, text=True, check=True).stdout
+        launch_time = time.perf_counter() - start
+        lines = [line for line in output.splitlines() if line.startswith(STARTUP_PREFIX)]
+        if not lines:
+            raise ValueError(f"Blender did not report the addon startup:\n{output}")
+        result = json.loads(lines[-1][len(STARTUP_PREFIX):])
+        result["launch_time"] = launch_time
+        runs.append(result)
+
+    startup_times = [r["startup_time"] for r in runs]
+    return {
+        "best_time": min(startup_times),
+        "median_time": statistics.median(startup_times),
+        "launch_time": statistics.median(r["launch_time"] for r in runs),
+        "numpy_imported": any(r["numpy_imported"] for r in runs),
+    }
+
+
+def print_results(results):
+    print(f"{'Case':<16}{'Items':>8}{'Bones':>10}{'Size':>10}{'Best':>10}{'Median':>10}{'Items/s':>12}{'Bones/s':>12}{'MB/s':>9}")
+    for r in results:
+        print(f"{r['case']:<16}{r['items']:>8}{r['bones']:>10}{r['bytes'] / 1024 / 1024:>8.2f}MB"
+              f"{r['best_time'] * 1000:>8.1f}ms{r['median_time'] * 1000:>8.1f}ms"
+              f"{r['items_per_s']:>12,.0f}{r['bones_per_s']:>12,.0f}{r['mb_per_s']:>9.1f}")
+
+
+def compare_results(results, baseline, tolerance):
+    # Returns all cases whose bone throughput dropped by more than the tolerance compared to the baseline
+    baseline_cases = {r["case"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        base = baseline_cases.get(r["case"])
+        if not base:
+            continue
+        ratio = r["bones_per_s"] / base["bones_per_s"]
+        if ratio < 1 - tolerance:
+            regressions.append(f"{r['case']}: {r['bones_per_s']:,.0f} bones/s, baseline {base['bones_per_s']:,.0f} bones/s ({ratio - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description="Measures the .scene parser throughput on generated scenes.")
+    argument_parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="Cases to run, all by default")
+    argument_parser.add_argument("--repeats", type=int, default=5, help="How often each scene is parsed, the best time is reported")
+    argument_parser.add_argument("--items", type=int, help="Run a custom case with this many items instead")
+    argument_parser.add_argument("--bones", type=int, default=200, help="Bones per item of the custom case")
+    argument_parser.add_argument("--accessories", type=int, default=2, help="Accessories per item of the custom case")
+    argument_parser.add_argument("--string-length", type=int, default=16, help="Length of all strings of the custom case")
+    argument_parser.add_argument("--json", help="Save the results to this JSON file")
+    argument_parser.add_argument("--compare", help="Compare the results to a JSON file of an earlier run and fail on regressions")
+    argument_parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed throughput drop compared to the baseline (default 0.15)")
+    argument_parser.add_argument("--blender", help="Measure the addon startup in this Blender executable instead of the parser")
+    args = argument_parser.parse_args(argv)
+
+    if args.blender:
+        result = run_startup_benchmark(args.blender, repeats=max(1, args.repeats))
+        print(f"Addon startup: {result['best_time'] * 1000:.1f} ms best, {result['median_time'] * 1000:.1f} ms median "
+              f"(target {STARTUP_TARGET * 1000:.0f} ms), Blender launch {result['launch_time']:.2f}s, numpy imported: {result['numpy_imported']}")
+        return 0 if result["median_time"] <= STARTUP_TARGET and not result["numpy_imported"] else 1
+
+    if args.items is not None:
+        cases = {"custom": dict(item_count=args.items, bone_count=args.bones, accessory_count=args.accessories, string_length=args.string_length)}
+    else:
+        cases = {name: CASES[name] for name in args.cases}
+
+    results = run_benchmark(cases, repeats=max(1, args.repeats))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "results": results}, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print("\nParser regressions:")
+            for regression in regressions:
+                print(f"- {regression}")
+            return 1
+        print(f"\nNo regressions compared to {args.compare}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
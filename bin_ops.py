@@ -1,7 +1,12 @@
 
+import sys
+import mmap
 import struct
 import binascii
 
+from . import logger
+
+log = logger.get_logger("bin_ops")
 
 ENCODING_READ = 'utf-8-sig'
 ENCODING_WRITE = 'utf-8'
@@ -21,6 +26,213 @@ class TypeFormat:
     Double = '<d'
 
 
+# numpy is only imported once bones are decoded, so scenes can be inspected without paying for the numpy import
+_bone_dtype = None
+
+
+def get_bone_dtype():
+    # Bone record: name, rotation, location and scale (9 singles after the name)
+    global _bone_dtype
+    if _bone_dtype is None:
+        import numpy as np
+        _bone_dtype = np.dtype([
+            ('name', object),
+            ('rot', '<f8', (3,)),
+            ('loc', '<f8', (3,)),
+            ('scale', '<f8', (3,)),
+        ])
+    return _bone_dtype
+
+
+def make_bones(names, values):
+    # Bone records from a list of names and an (N, 9) array of rotation, location and scale values
+    import numpy as np
+
+    bones = np.empty(len(names), dtype=get_bone_dtype())
+    bones['name'] = names
+    bones['rot'] = values[:, 0:3]
+    bones['loc'] = values[:, 3:6]
+    bones['scale'] = values[:, 6:9]
+    return bones
+
+
+class BinaryReadError(ValueError):
+    pass
+
+
+class BinaryReader:
+    # Precompiled structs, these decode directly from the buffer without creating intermediate bytes objects
+    _byte = struct.Struct(TypeFormat.Byte)
+    _int16 = struct.Struct(TypeFormat.Int16)
+    _uint16 = struct.Struct(TypeFormat.UInt16)
+    _uint32 = struct.Struct(TypeFormat.UInt32)
+    _single = struct.Struct(TypeFormat.Single)
+    _bone = struct.Struct('<9f')
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+        self.size = len(self.buffer)
+        self.offset = 0
+
+        # Decoded names by their raw bytes
+        self._names = {}
+
+        self._file = None
+        self._mmap = None
+
+    @classmethod
+    def from_file(cls, filepath):
+        file = open(filepath, 'rb')
+        try:
+            file_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            file.close()
+            return cls(b'')
+
+        reader = cls(file_mmap)
+        reader._file = file
+        reader._mmap = file_mmap
+        return reader
+
+    def close(self):
+        # The file is closed in any case. If a slice of the buffer is still referenced somewhere, the mmap is freed with the last reference
+        try:
+            self.buffer.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            log.debug("Buffer of the binary reader is still referenced")
+        finally:
+            self._mmap = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def tell(self):
+        return self.offset
+
+    def remaining(self):
+        return self.size - self.offset
+
+    def _check(self, length):
+        if self.offset + length > self.size:
+            raise BinaryReadError(f"Unexpected end of file: Tried to read {length} bytes at offset {self.offset}, but the file is only {self.size} bytes long.")
+
+    def _unpack(self, fmt: struct.Struct):
+        self._check(fmt.size)
+        value = fmt.unpack_from(self.buffer, self.offset)
+        self.offset += fmt.size
+        return value
+
+    def skip(self, length):
+        self._check(length)
+        self.offset += length
+
+    def readByte(self):
+        return self._unpack(self._byte)[0]
+
+    def readInt16(self):
+        return self._unpack(self._int16)[0]
+
+    def readUInt16(self):
+        return self._unpack(self._uint16)[0]
+
+    def readUInt32(self):
+        return self._unpack(self._uint32)[0]
+
+    def readSingle(self, round_to=None):
+        single = self._unpack(self._single)[0]
+        if round_to is not None:
+            single = round(single, round_to)
+        return single
+
+    def readSingles(self, count, round_to=None):
+        return tuple(self.readSingle(round_to=round_to) for _ in range(count))
+
+    def _readStringPayload(self):
+        # Read the byte indicating the string length
+        string_length = self.readByte()
+
+        # Handle edge case where a "01" follows the string length. Maybe this is a bone visibility flag?
+        if self.offset < self.size and self.buffer[self.offset] == 1:
+            self.offset += 1
+            log.debug("Handled edge case '01' after string length")
+
+        # Copy out the string of the indicated length. A memoryview slice would keep the buffer exported,
+        # e.g. in a UnicodeDecodeError, and then the reader can't be closed anymore
+        self._check(string_length)
+        start = self.offset
+        self.offset += string_length
+        return bytes(self.buffer[start:self.offset])
+
+    def readString(self):
+        payload = self._readStringPayload()
+        string, length = decodeString(payload)
+        # Don't consume anything after a null character
+        self.offset -= len(payload) - length
+        return string
+
+    def readName(self):
+        # Names repeat for every item using the same rig, so each distinct name is only decoded once
+        # and all items share the same interned string
+        payload = self._readStringPayload()
+        name = self._names.get(payload)
+        if name is not None:
+            return name
+
+        name, length = decodeString(payload)
+        name = sys.intern(name)
+        if length == len(payload):
+            self._names[payload] = name
+        else:
+            self.offset -= len(payload) - length
+        return name
+
+    def skipBones(self, bone_count):
+        # Walks over the bones without decoding them, the names have a variable length so they can't be skipped in one go.
+        # Same layout as in _readStringPayload, but with local variables only, as this runs for every bone of every item
+        buffer = self.buffer
+        size = self.size
+        bone_size = self._bone.size
+        offset = self.offset
+        for _ in range(bone_count):
+            if offset >= size:
+                break
+            string_length = buffer[offset]
+            offset += 1
+            if offset < size and buffer[offset] == 1:
+                offset += 1
+            offset += string_length + bone_size
+        else:
+            if offset <= size:
+                self.offset = offset
+                return
+        raise BinaryReadError(f"Unexpected end of file: Tried to skip {bone_count} bones at offset {self.offset}, but the file is only {self.size} bytes long.")
+
+    def readBones(self, bone_count, round_to=None):
+        # Only the names have to be read one by one, the 9 singles of each bone are unpacked in one go
+        import numpy as np
+
+        names = []
+        values = []
+        for _ in range(bone_count):
+            names.append(self.readName())
+            values.append(self._unpack(self._bone))
+
+        data = np.array(values, dtype=np.float64).reshape(bone_count, 9)
+        if round_to is not None:
+            data = data.round(round_to)
+
+        return make_bones(names, data)
+
+
 def roundToMultiple(numToRound, multiple):
     return (numToRound + multiple - 1) // multiple * multiple
 
@@ -90,38 +302,56 @@ def writeSingle(number):
 
 def readString(file):
     # Read the byte as an integer indicating the string length
-    byte = file.read(1) + b'\x00'
-    string_length = struct.unpack(TypeFormat.UInt16, byte)[0]
-    # print(string_length, binascii.hexlify(byte))
+    string_length = readByte(file)
 
     # Handle edge case where a "01" follows the string length. Maybe this is a bone visibility flag?
     byte = file.read(1)
     if byte != b'\x01':
-        file.seek(file.tell() - 1)
+        file.seek(file.tell() - len(byte))
     else:
-        print("Handled edge case '01' after string length")
-
-    # Read the string of the indicated length
-    string = ""
-    for i in range(string_length):
-        # print(string, binascii.hexlify(byte))
-        byte = file.read(1)
-        if byte == b'\x00':
-            print("WARNING: String contains null character. This should never happen!")
-            file.seek(file.tell() - 1)
-            break
-        char = decodeBytes(byte)
-        string += char
-    # print(string)
+        log.debug("Handled edge case '01' after string length")
+
+    # Read the string of the indicated length in one go
+    payload = file.read(string_length)
+    string, length = decodeString(payload)
+    if length != len(payload):
+        file.seek(file.tell() - len(payload) + length)
     return string
 
 
+def decodeString(payload):
+    # Decodes the whole string payload at once and returns the string and the number of bytes it used up.
+    # The payload can be bytes or a memoryview
+    string = str(payload, ENCODING_READ)
+    if '\x00' not in string:
+        return string, len(payload)
+
+    log.warning("String contains null character. This should never happen!")
+    # The string ends in front of the null character, the rest of the payload is not consumed
+    length = bytes(payload).index(b'\x00')
+    return str(payload[:length], ENCODING_READ), length
+
+
 def writeString(string):
     # String Length
     byteString = encodeString(string)
     return byteString
 
 
+def writeStringWithLength(string):
+    # Writes the string the way readString() reads it: the length byte followed by the string.
+    # Lengths of 128 and above get the extra "01" byte that readString() skips, so only up to 255 bytes are readable
+    byteString = encodeString(string)
+    length = len(byteString)
+    if length > 255:
+        raise ValueError(f"String '{string}' is too long ({length} bytes), only strings up to 255 bytes are supported.")
+
+    lengthBin = writeByte(length)
+    if length >= 128:
+        lengthBin += writeByte(1)
+    return lengthBin + byteString
+
+
 def decodeBytes(bytes):
     # print(bytes)
     return bytes.decode(ENCODING_READ)
@@ -0,0 +1,307 @@
+# Searchable catalog of a .scene library, runs without Blender.
+#
+# Usage (from the folder containing the addon folder):
+#   python -m <addon folder>.catalog scan <scene folder> [--catalog FILE] [--jobs N]
+#   python -m <addon folder>.catalog uses <model name, folder or folder/name> [--catalog FILE] [--visible-only]
+#   python -m <addon folder>.catalog missing --asset-dir DIR [--install-dir DIR] [--catalog FILE]
+#
+# scan parses every scene below the folder in a process pool and stores its items in an SQLite database.
+# Scenes are only parsed again when their mtime or size changed, and scenes that no longer exist are removed.
+# The bones are skipped while scanning, so the workers don't import numpy.
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+import pathlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from . import logger
+from . import parser
+from .asset_index import AssetIndex
+from .scene_files import run_cli
+
+log = logger.get_logger("catalog")
+
+DEFAULT_CATALOG_FILE = "xps_scene_catalog.db"
+SCENE_SUFFIX = ".scene"
+
+# Scenes are written in batches, so an interrupted scan keeps most of its progress
+COMMIT_INTERVAL = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    version TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    scene_id INTEGER NOT NULL REFERENCES scenes(id) ON DELETE CASCADE,
+    item_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    visibility INTEGER NOT NULL,
+    bone_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_scene ON items(scene_id);
+CREATE INDEX IF NOT EXISTS items_name ON items(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS items_folder ON items(folder COLLATE NOCASE);
+"""
+
+
+def get_item_folder(item_path):
+    # Name of the character folder of an item, scenes store the paths with backslashes
+    return item_path.replace("/", "\\").rstrip("\\").split("\\")[-1]
+
+
+def _init_worker():
+    # The parser logs every step of every scene on the info level
+    logger.set_level(logging.WARNING)
+
+
+def read_scene(filepath):
+    # Runs in the worker processes. Returns the version and the items of a scene, or the error if it can't be read
+    try:
+        document = parser.parse_scene(filepath, read_bones=False)
+    except (OSError, ValueError) as e:
+        return filepath, None, [], str(e)
+
+    version = ".".join(str(x) for x in document.version)
+    items = [(item.index, item.name, item.path, get_item_folder(item.path), item.visibility, item.bone_count) for item in document.items]
+    return filepath, version, items, None
+
+
+def find_scene_files(root):
+    # Returns the path, mtime and size of every .scene file below the folder
+    files = {}
+    stack = [str(root)]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(SCENE_SUFFIX):
+                            stat = entry.stat()
+                            files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        continue
+        except OSError:
+            log.warning("Could not list folder '%s'", path)
+    return files
+
+
+class SceneCatalog:
+    # SQLite index of the items of many scenes.
+    # Scenes are stored with their absolute path, mtime and size, which decide whether they have to be parsed again
+    version = 1
+
+    def __init__(self, catalog_file=DEFAULT_CATALOG_FILE):
+        self.catalog_file = pathlib.Path(catalog_file)
+        self.connection = sqlite3.connect(str(self.catalog_file))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+
+        # Catalogs of an older version are rebuilt from scratch
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != self.version:
+            self.connection.executescript("DROP TABLE IF EXISTS items; DROP TABLE IF EXISTS scenes;")
+            self.connection.execute(f"PRAGMA user_version = {self.version}")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def scan(self, root, jobs=None):
+        # Brings the catalog up to date with the scenes below the folder. Returns the number of found, parsed, removed and failed scenes
+        start = time.time()
+        root = os.path.abspath(root)
+        files = find_scene_files(root)
+
+        known = {}
+        prefix = os.path.join(root, "")
+        for scene_id, path, mtime_ns, size in self.connection.execute("SELECT id, path, mtime_ns, size FROM scenes"):
+            if path.startswith(prefix):
+                known[path] = (scene_id, mtime_ns, size)
+
+        changed = [path for path, state in files.items() if path not in known or known[path][1:] != state]
+        removed = [known[path][0] for path in known if path not in files]
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM scenes WHERE id = ?", ((scene_id,) for scene_id in removed))
+
+        failed_count = 0
+        for i, (filepath, version, items, error) in enumerate(self._read_scenes(sorted(changed), jobs)):
+            if error:
+                failed_count += 1
+                log.warning("Could not read scene '%s': %s", filepath, error)
+            self._store_scene(filepath, files[filepath], version, items, error)
+            if (i + 1) % COMMIT_INTERVAL == 0:
+                self.connection.commit()
+        self.connection.commit()
+
+        log.info("Scanned '%s' in %.2fs (%s scenes, %s parsed, %s removed, %s failed)",
+                 root, time.time() - start, len(files), len(changed), len(removed), failed_count)
+        return {"scenes": len(files), "parsed": len(changed), "removed": len(removed), "failed": failed_count}
+
+    @staticmethod
+    def _read_scenes(filepaths, jobs=None):
+        jobs = jobs or os.cpu_count() or 1
+        if jobs <= 1 or len(filepaths) <= 1:
+            log_level = logger.get_level()
+            _init_worker()
+            try:
+                yield from map(read_scene, filepaths)
+            finally:
+                logger.set_level(log_level)
+            return
+
+        # Small chunks keep all workers busy until the end, big ones keep the overhead of the pool low
+        chunksize = max(1, min(64, len(filepaths) // (jobs * 8)))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+            yield from executor.map(read_scene, filepaths, chunksize=chunksize)
+
+    def _store_scene(self, filepath, state, version, items, error):
+        mtime_ns, size = state
+        row = self.connection.execute("SELECT id FROM scenes WHERE path = ?", (filepath,)).fetchone()
+        if row:
+            scene_id = row[0]
+            self.connection.execute("UPDATE scenes SET mtime_ns = ?, size = ?, version = ?, error = ? WHERE id = ?",
+                                    (mtime_ns, size, version, error, scene_id))
+            self.connection.execute("DELETE FROM items WHERE scene_id = ?", (scene_id,))
+        else:
+            scene_id = self.connection.execute("INSERT INTO scenes (path, mtime_ns, size, version, error) VALUES (?, ?, ?, ?, ?)",
+                                               (filepath, mtime_ns, size, version, error)).lastrowid
+        self.connection.executemany("INSERT INTO items (scene_id, item_index, name, path, folder, visibility, bone_count) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    ((scene_id, *item) for item in items))
+
+    def find_scenes_using(self, model, visible_only=False):
+        # Returns the paths of the scenes that contain the model, with the number of matching items.
+        # The model is a mesh name, a character folder name or "folder/name", all case-insensitive
+        folder, _, name = model.replace("\\", "/").rstrip("/").rpartition("/")
+        if folder:
+            condition = "i.folder = ? COLLATE NOCASE AND i.name = ? COLLATE NOCASE"
+            parameters = [get_item_folder(folder), name]
+        else:
+            condition = "(i.name = ? COLLATE NOCASE OR i.folder = ? COLLATE NOCASE)"
+            parameters = [name, name]
+        if visible_only:
+            condition += " AND i.visibility != 0"
+
+        return self.connection.execute(f"SELECT s.path, COUNT(*) FROM items i JOIN scenes s ON s.id = i.scene_id "
+                                       f"WHERE {condition} GROUP BY s.id ORDER BY s.path", parameters).fetchall()
+
+    def get_models(self):
+        # Returns all distinct (item path, name) pairs of the items in the catalog
+        return self.connection.execute("SELECT DISTINCT path, name FROM items WHERE name != ''").fetchall()
+
+    def find_missing_models(self, asset_dir, install_dir=None):
+        # Returns {scene path: [(item path, item name)]} of all scenes with models that can't be found.
+        # Like utils.search_dirs_for_model, the stored path of the item is checked first, then the installation folder,
+        # and then the asset folder for a folder with the name of the item folder that contains the mesh file
+        asset_index = AssetIndex(asset_dir, self.catalog_file.with_name(self.catalog_file.stem + "_assets.json"))
+        asset_index.load()
+        asset_index.refresh()
+
+        # Asset folder results by lower-cased (folder, name), many items share the same model
+        in_assets = {}
+        missing = set()
+        for path, name in self.get_models():
+            if _find_mesh_file(path, name):
+                continue
+            if install_dir and _find_mesh_file(pathlib.Path(install_dir, *path.split("\\")), name):
+                continue
+
+            folder = get_item_folder(path)
+            key = (folder.lower(), name.lower())
+            if key not in in_assets:
+                in_assets[key] = any(asset_index.find_mesh_in_folder(asset_folder, name) for asset_folder in asset_index.find_folders(folder))
+            if not in_assets[key]:
+                missing.add((path, name))
+
+        scenes = {}
+        query = "SELECT s.path, i.path, i.name FROM items i JOIN scenes s ON s.id = i.scene_id WHERE i.name != '' ORDER BY s.path, i.item_index"
+        for scene_path, item_path, name in self.connection.execute(query):
+            if (item_path, name) in missing:
+                models = scenes.setdefault(scene_path, [])
+                if (item_path, name) not in models:
+                    models.append((item_path, name))
+        return scenes
+
+
+def _find_mesh_file(folder, name):
+    # Same check as utils.search_dir_for_file, without Blender
+    try:
+        with os.scandir(folder) as entries:
+            return any(os.path.splitext(entry.name)[0].lower() == name.lower() and os.path.splitext(entry.name)[1] in (".mesh", ".xps", ".ascii")
+                       for entry in entries)
+    except OSError:
+        return False
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description="Catalog of a .scene library, to find the scenes that use a model or reference missing models.")
+    argument_parser.add_argument("--catalog", default=DEFAULT_CATALOG_FILE, help=f"Catalog database file (default {DEFAULT_CATALOG_FILE})")
+    commands = argument_parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser("scan", help="Add new and changed scenes below a folder to the catalog")
+    scan_parser.add_argument("folder", help="Folder containing the scene files, it is searched recursively")
+    scan_parser.add_argument("--jobs", type=int, help="Number of worker processes, all cores by default")
+
+    uses_parser = commands.add_parser("uses", help="List the scenes that use a model")
+    uses_parser.add_argument("model", help="Mesh name, character folder name or folder/name")
+    uses_parser.add_argument("--visible-only", action="store_true", help="Ignore hidden items")
+
+    missing_parser = commands.add_parser("missing", help="List the scenes with models that can't be found in the asset folder")
+    missing_parser.add_argument("--asset-dir", required=True, help="XPS asset folder")
+    missing_parser.add_argument("--install-dir", help="XPS installation folder, also searched for the models")
+
+    args = argument_parser.parse_args(argv)
+
+    # Keep stdout for the query results
+    logger.console_handler.setStream(sys.stderr)
+
+    return run_cli(run_command, args)
+
+
+def run_command(args):
+    with SceneCatalog(args.catalog) as catalog:
+        if args.command == "scan":
+            result = catalog.scan(args.folder, jobs=args.jobs)
+            return 1 if result["failed"] else 0
+
+        if args.command == "uses":
+            scenes = catalog.find_scenes_using(args.model, visible_only=args.visible_only)
+            for path, item_count in scenes:
+                print(f"{path} ({item_count} items)")
+            print(f"{len(scenes)} scenes use '{args.model}'", file=sys.stderr)
+            return 0
+
+        if args.command == "missing":
+            if not os.path.isdir(args.asset_dir):
+                print(f"Asset folder '{args.asset_dir}' does not exist.", file=sys.stderr)
+                return 1
+            scenes = catalog.find_missing_models(args.asset_dir, args.install_dir)
+            for path, models in scenes.items():
+                print(path)
+                for item_path, name in models:
+                    print(f"    {item_path}\\{name}")
+            print(f"{len(scenes)} scenes reference missing models", file=sys.stderr)
+            return 1 if scenes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import numpy as np
+
+# Conversion of vectors from XPS space (Y up) to Blender space (Z up).
+# All functions accept a single (3,) vector or an (N, 3) array and return the same shape.
+
+# XPS to Blender is a rotation of 90° around the X axis: (x, y, z) -> (x, -z, y)
+XPS_TO_BLENDER = np.array((
+    (1, 0, 0),
+    (0, 0, -1),
+    (0, 1, 0),
+), dtype=np.float64)
+
+# Scales and rotation angles only swap their axes, scales don't get negated
+XPS_TO_BLENDER_SCALE = np.abs(XPS_TO_BLENDER)
+
+# Blender euler order of the converted XPS rotations
+ROTATION_ORDER = 'YXZ'
+
+
+def _convert(vectors, matrix):
+    # Row vectors, so "vectors @ matrix.T" is the same as "matrix @ vector" for every vector
+    vectors = np.asarray(vectors, dtype=np.float64)
+    if vectors.size == 0:
+        vectors = vectors.reshape(0, 3)
+    return vectors @ matrix.T
+
+
+def location_to_blender(locations):
+    # Locations, directions and bone translations
+    return _convert(locations, XPS_TO_BLENDER)
+
+
+def scale_to_blender(scales):
+    return _convert(scales, XPS_TO_BLENDER_SCALE)
+
+
+def rotation_to_blender(rotations):
+    # XPS rotations in degrees to Blender euler angles in radians, in ROTATION_ORDER
+    return np.radians(_convert(rotations, XPS_TO_BLENDER))
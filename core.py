@@ -5,6 +5,7 @@ import math
 import json
 import copy
 import time
+import uuid
 import os.path
 import pathlib
 from math import radians, degrees
@@ -12,19 +13,86 @@ from mathutils import Color, Matrix, Euler, Vector
 from threading import Thread
 from bpy.app.handlers import persistent
 
+from . import instrumentation
+from . import logger
+from . import model_cache
+from . import transaction
 from . import utils
 
+log = logger.get_logger("core")
+
+# XPS always imports the ground from this model
+GROUND_MODEL_PATH = "data\\Floor\\Floor"
+GROUND_MODEL_NAME = "generic_item"
+GROUND_MODEL_ERROR = "Could not find ground model, probably due to an unknown XPS installation folder."
+
+# Custom properties of placeholder empties, which stand in for hidden models until they are needed
+PLACEHOLDER_PROPERTY = "xps_placeholder"
+PLACEHOLDER_ID = "xps_placeholder_id"  # Stays the same when the placeholder gets renamed
+PLACEHOLDER_DIRECTORY = "xps_model_directory"
+PLACEHOLDER_NAME = "xps_model_name"
+PLACEHOLDER_MODEL_PATH = "xps_model_path"
+PLACEHOLDER_BONE_NAMES = "xps_bone_names"
+PLACEHOLDER_BONE_VALUES = "xps_bone_values"
+
+# Custom properties that link the created collection and objects to the scene file,
+# so a later import of the same file can update them instead of creating everything again
+SCENE_FILE_PROPERTY = "xps_scene_file"
+SCENE_OPTIONS_PROPERTY = "xps_import_options"
+SCENE_HASH_PROPERTY = "xps_hash_{}"
+PART_PROPERTY = "xps_part"  # "controller", "item", "camera", "lights" or "ground"
+ITEM_INDEX_PROPERTY = "xps_item_index"
+ITEM_KEY_PROPERTY = "xps_item_key"
+ITEM_HASH_PROPERTY = "xps_item_hash"
+
+# What happens with models that are hidden in the scene
+HIDDEN_MODELS_IMPORT = "IMPORT"  # Import them like all other models, but hide them
+HIDDEN_MODELS_PLACEHOLDER = "PLACEHOLDER"  # Add placeholder empties that import the model once they get unhidden
+HIDDEN_MODELS_EXCLUDE = "EXCLUDE"  # Don't import them at all
+
+# How XPS .pose files are applied to an armature
+POSE_MODE_APPLY = "APPLY"  # Pose the armature with a single pose file
+POSE_MODE_KEYFRAMES = "KEYFRAMES"  # Every pose file in the folder becomes a keyframe
+POSE_MODE_LIBRARY = "LIBRARY"  # Every pose file in the folder becomes a pose library entry (an Action marked as asset)
+
+# The pose and import_handler modules are imported on first use instead of at the top,
+# since they load numpy, which would otherwise slow down the start of Blender
+
+
+def get_model_error(file_directory, file_name, character_folder, mesh_file):
+    # Returns the error message for a model that was not found, or None if it was found
+    if not character_folder or not character_folder.exists():
+        folder_name = file_directory.split("\\")[-1]
+        return f"Model '{folder_name}' was not found in any selected folder. Full original path: '{file_directory}'"
+    if not mesh_file:
+        return f"Could not find any folder '{character_folder.name}' containing the file '{file_name}' (.xps, .mesh, .ascii)."
+    return None
+
 
 class SceneConstructor:
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, collection=None, scene_controller=None, use_model_cache=True):
         self.name = name
         self.error_handler: ErrorHandler = ErrorHandler()
+        self.use_model_cache = use_model_cache
 
-        self.collection, self.layer_collection, self.scene_controller = self._create_scene_collection()
+        # Either create a new scene collection or continue working in the one of an earlier import
+        if collection:
+            self.collection = collection
+            self.layer_collection = utils.find_layer_collection(collection.name)
+            self.scene_controller = scene_controller or next(iter(self.get_part_objects("controller")), None)
+        else:
+            self.collection, self.layer_collection, self.scene_controller = self._create_scene_collection()
         self.can_import_characters = utils.check_for_xps_importer()
 
         self.active_armature = None
+        self.pose_appliers = {}
+
+        # Already imported characters by their mesh file path, repeated characters get duplicated from these
+        self.imported_characters = {}
+
+        # Search results by (file_directory, file_name), filled by resolve_models before the characters get added
+        self.resolved_models = {}
 
     def _create_scene_collection(self):
         collection = bpy.data.collections.new(self.name)
@@ -34,19 +102,21 @@ class SceneConstructor:
 
         scene_controller = utils.create_empty(link_collection=collection)
         scene_controller.name = "Scene Controller"
+        scene_controller[PART_PROPERTY] = "controller"
         return collection, layer_collection, scene_controller
 
     def create_light(self, index, direction, intensity, color, shadow_depth):
+        # The direction has to be converted to Blender space already, see conversion.location_to_blender
         # Set name
         name = f"Light {index}"
 
         # Create light
         light_data = bpy.data.lights.new(name=name, type='SUN')
         light = bpy.data.objects.new(name=name, object_data=light_data)
+        light[PART_PROPERTY] = "lights"
         self.collection.objects.link(light)
 
-        # Rotate light direction from XPS to Blender
-        direction = utils.rotate(direction, (90, 0, 0))
+        direction = Vector(direction)
 
         sun = False
 
@@ -68,7 +138,7 @@ class SceneConstructor:
             c.s += 0.1
 
             light.data.type = "POINT"
-            light.location = -direction * 3
+            transaction.current.set(light, "location", -direction * 3)
             light.data.energy = intensity * 2.4
             light.data.color = c
             light.data.shadow_soft_size = 2
@@ -77,38 +147,40 @@ class SceneConstructor:
 
             # Create empty at the center so the light can be easily rotated
             empty = utils.create_empty(link_collection=self.collection)
-            empty.location[2] += 1
+            transaction.current.set(empty, "location", (0, 0, 1))
             empty.name = f"{light.name} Controller"
-            light.parent = empty
+            empty[PART_PROPERTY] = "lights"
+            transaction.current.set_parent(light, empty)
 
-            empty.parent = self.scene_controller
+            transaction.current.set_parent(empty, self.scene_controller)
 
     def create_camera(self, fov, target_pos, distance, rotation_horizontal, rotation_vertical):
+        # The target position has to be converted to Blender space already
         # Create camera object
         camera_data = bpy.data.cameras.new(name="Camera")
         camera = bpy.data.objects.new(name="Camera", object_data=camera_data)
+        camera[PART_PROPERTY] = "camera"
         self.collection.objects.link(camera)
 
         # Create camera controller
         camera_controller = utils.create_empty(link_collection=self.collection)
         camera_controller.name = "Camera Controller"
-        camera.parent = camera_controller
-        camera_controller.parent = self.scene_controller
+        camera_controller[PART_PROPERTY] = "camera"
+        transaction.current.set_parent(camera, camera_controller)
+        transaction.current.set_parent(camera_controller, self.scene_controller)
 
         # Move camera to the correct distance
-        camera.location[2] = distance
+        camera_location = Vector((0, 0, distance))
+        transaction.current.set(camera, "location", camera_location)
 
         # Make camera look at the empty
-        utils.look_at(camera, camera_controller.location)
-
-        # Rotate target location from XPS space to Blender space
-        target_pos = utils.rotate(target_pos, (90, 0, 0))
+        utils.look_at(camera, Vector((0, 0, 0)), location=camera_location)
 
         # Move the controller to the target location
-        camera_controller.location = target_pos
+        transaction.current.set(camera_controller, "location", target_pos)
 
         # Rotate controller by the rotation values
-        camera_controller.rotation_euler = (radians(90) - rotation_vertical, 0, rotation_horizontal)
+        transaction.current.set(camera_controller, "rotation_euler", (radians(90) - rotation_vertical, 0, rotation_horizontal))
 
         # Calculate the field of view angle
         angle_unit = 0.0872664600610733 / 5
@@ -126,51 +198,152 @@ class SceneConstructor:
         # Set this camera to active
         bpy.context.scene.camera = camera
 
+    def resolve_models(self, models):
+        # Search for all models of the scene at once, before any of them gets imported
+        if not self.can_import_characters:
+            return
+        self.resolved_models.update(utils.resolve_models(models))
+
     def add_character(self, file_directory, file_name, visibility):
         self.active_armature = None
         if not self.can_import_characters:
             self.error_handler.add_error("XPS Importer not installed, skipping character import.")
             return
 
-        # Search for the model directory in the install and asset folders
-        character_folder, mesh_file = utils.search_dirs_for_model(file_directory, file_name)
+        # Search for the model directory in the install and asset folders, unless it was already resolved
+        resolved = self.resolved_models.get((file_directory, file_name))
+        if resolved:
+            character_folder, mesh_file = resolved
+        else:
+            character_folder, mesh_file = utils.search_dirs_for_model(file_directory, file_name)
 
-        if not character_folder or not character_folder.exists():
-            folder_name = file_directory.split("\\")[-1]
-            self.error_handler.add_error(f"Model '{folder_name}' was not found in any selected folder. Full original path: '{file_directory}'")
-            return
-        if not mesh_file:
-            self.error_handler.add_error(f"Could not find any folder '{character_folder.name}' containing the file '{file_name}' (.xps, .mesh, .ascii).")
+        error = get_model_error(file_directory, file_name, character_folder, mesh_file)
+        if error:
+            self.error_handler.add_error(error)
             return
 
         filepath_full = character_folder / mesh_file
-        print(f"\nImporting character {str(filepath_full)}...")
+
+        # If this model was already imported into this scene, create a linked duplicate of it instead of importing it again
+        source = self.imported_characters.get(str(filepath_full))
+        if source:
+            log.info("Duplicating character %s...", filepath_full)
+            self.active_armature, objects = self._duplicate_character(*source)
+            transaction.current.set_parent(self.active_armature, self.scene_controller)
+            self._set_character_visibility(objects, visibility)
+            utils.set_hide(self.active_armature, True)
+
+            # The duplicate has the pose of the source character, so reset it before it gets posed
+            self.get_pose_applier(self.active_armature).reset()
+            return
+
+        # Append the character from the model cache if it was imported before, otherwise import it with the XPS importer
+        objects = None
+        if self.use_model_cache:
+            with instrumentation.current.timer("model cache load"):
+                objects = model_cache.load(filepath_full, self.collection)
+        if objects:
+            log.info("Loaded character %s from the model cache", filepath_full)
+        else:
+            objects = self._import_character(filepath_full)
+            if not objects:
+                return
+            if self.use_model_cache:
+                with instrumentation.current.timer("model cache save"):
+                    model_cache.save(filepath_full, objects)
+
+        # Hide all objects of the character if they should be hidden
+        self._set_character_visibility(objects, visibility)
+
+        # Get the armature of the character and set it as active
+        for obj in objects:
+            if obj.type == "ARMATURE":
+                self.active_armature = obj
+                transaction.current.set_parent(self.active_armature, self.scene_controller)
+                self.active_armature.name = character_folder.parts[-1]
+                utils.set_hide(self.active_armature, True)
+                break
+        if not self.active_armature:
+            self.error_handler.add_error(f"Character '{filepath_full}' does not contain an armature, skipping character pose.")
+            return
+
+        self.imported_characters[str(filepath_full)] = (self.active_armature, objects)
+
+    def _import_character(self, filepath_full):
+        # Imports the character with the XPS importer and returns all of its objects, moved into this XPS scene collection
+        log.info("Importing character %s...", filepath_full)
 
         # Set the active collection to this XPS scene collection
         bpy.context.view_layer.active_layer_collection = self.layer_collection
 
-        # Save all current collections to check witch one was added
-        collections_pre = [c for c in bpy.data.collections]
+        # The XPS importer adds the character collection to the active collection, so only the children of this collection need to be compared.
+        # Comparing all collections of the file would make every import slower the bigger the .blend file gets
+        children_pre = {c.as_pointer() for c in self.collection.children}
 
         # Import the character from the given path
         bpy.ops.xps_tools.import_model(
             "EXEC_DEFAULT",
             filepath=str(filepath_full),
         )
-        print(f"Imported character {str(filepath_full)}...\n")
+        log.info("Imported character %s", filepath_full)
 
-        # Get the added collection
-        character_collection = None
-        for c in bpy.data.collections:
-            if c not in collections_pre:
-                character_collection = c
-                break
+        # Get the added collection, or the collection of the imported armature if the importer linked it somewhere else
+        character_collection = next((c for c in self.collection.children if c.as_pointer() not in children_pre), None)
+        if not character_collection:
+            active = bpy.context.view_layer.objects.active
+            if active and active.users_collection and active.users_collection[0] not in (self.collection, bpy.context.scene.collection):
+                character_collection = active.users_collection[0]
         if not character_collection:
             self.error_handler.add_error(f"Imported character '{filepath_full}' collection not found, skipping character import.")
-            return
+            return None
 
-        # Hide all objects in the collection if they should be hidden
-        for obj in character_collection.objects:
+        # Move all objects from the character-collection to this xps scene collection.
+        # Removing the character collection afterwards unlinks all objects from it at once
+        objects = list(character_collection.objects)
+        for obj in objects:
+            self.collection.objects.link(obj)
+
+        # Delete the character collection
+        bpy.data.collections.remove(character_collection, do_unlink=True)
+        return objects
+
+    def add_placeholder(self, file_directory, file_name, bones, location, scale):
+        # Instead of importing a hidden model, add an empty that stores everything needed to import it later.
+        # The empty gets replaced by the real model when it is unhidden or loaded via the operator.
+        # Location and scale are in Blender space, like in transform_character
+        self.active_armature = None
+
+        model_path = ""
+        folder_name = file_directory.split("\\")[-1]
+        resolved = self.resolved_models.get((file_directory, file_name))
+        if resolved and resolved[1]:
+            character_folder, mesh_file = resolved
+            model_path = str(character_folder / mesh_file)
+            folder_name = character_folder.parts[-1]
+
+        placeholder = utils.create_empty(link_collection=self.collection)
+        placeholder.name = f"{folder_name} (Hidden)"
+        transaction.current.set_parent(placeholder, self.scene_controller)
+        placeholder.empty_display_type = 'CUBE'
+        placeholder.empty_display_size = 0.5
+
+        placeholder[PLACEHOLDER_PROPERTY] = True
+        placeholder[PLACEHOLDER_ID] = uuid.uuid4().hex
+        placeholder[PLACEHOLDER_DIRECTORY] = file_directory
+        placeholder[PLACEHOLDER_NAME] = file_name
+        placeholder[PLACEHOLDER_MODEL_PATH] = model_path
+        from . import pose
+        placeholder[PLACEHOLDER_BONE_NAMES], placeholder[PLACEHOLDER_BONE_VALUES] = pose.pack_bones(bones)
+
+        transaction.current.set(placeholder, "location", location)
+        transaction.current.set(placeholder, "scale", scale)
+
+        utils.set_hide(placeholder, True)
+        PlaceholderHandler.add(placeholder)
+        return placeholder
+
+    def _set_character_visibility(self, objects, visibility):
+        for obj in objects:
 
             # Hide and rename all accessories
             if obj.parent and obj.parent.type == "ARMATURE":
@@ -193,58 +366,107 @@ class SceneConstructor:
             # Hide the rest of the objects
             utils.set_hide(obj, not visibility)
 
-        # Get the armature from the collection and set it as active
-        for obj in character_collection.objects:
-            if obj.type == "ARMATURE":
-                self.active_armature = obj
-                self.active_armature.parent = self.scene_controller
-                self.active_armature.name = character_folder.parts[-1]
-                utils.set_hide(self.active_armature, True)
-                break
+    def _duplicate_character(self, source_armature, source_objects):
+        # Copy the objects, but keep sharing the armature, mesh and material data with the source character
+        copies = {}
+        for obj in source_objects:
+            obj_copy = obj.copy()
+            self.collection.objects.link(obj_copy)
+            copies[obj] = obj_copy
+
+        # Point the parents and armature modifiers to the copied objects
+        for obj_copy in copies.values():
+            if obj_copy.parent in copies:
+                transaction.current.set_parent(obj_copy, copies[obj_copy.parent])
+            for modifier in obj_copy.modifiers:
+                if modifier.type == "ARMATURE" and modifier.object in copies:
+                    modifier.object = copies[modifier.object]
+
+        return copies[source_armature], list(copies.values())
+
+    def pose_character(self, bones):
         if not self.active_armature:
-            self.error_handler.add_error(f"Character collection '{character_collection.name}' does not contain an armature, skipping character pose.")
             return
 
-        # Move all objects from the character-collection to this xps scene collection
-        for obj in character_collection.objects:
-            self.collection.objects.link(obj)
-            character_collection.objects.unlink(obj)
+        # Pose all bones at once, bones that the armature doesn't contain are skipped
+        transaction.current.apply_pose(self.get_pose_applier(self.active_armature), bones)
 
-        # Delete the character collection
-        bpy.data.collections.remove(character_collection, do_unlink=True)
-
-    def pose_character(self, bone_name, rot, loc, scale):
-        if not self.active_armature:
-            return
-
-        # Get the bone
-        bone = self.active_armature.pose.bones.get(bone_name)
-        if not bone:
-            # print(f"Armature '{self.active_armature.name}' does not contain bone '{bone_name}', skipping bone pose.")
-            return
-
-        # Posing bone
-        if rot[0] or rot[1] or rot[2]:
-            utils.xps_bone_rotate(bone, Vector(rot))
-
-        if loc[0] or loc[1] or loc[2]:
-            utils.xps_bone_translate(bone, Vector(loc))
-
-        if scale[0] != 1 or scale[1] != 1 or scale[2] != 1:
-            # TODO: This is absolutely not like the XPS behavior, but it's somewhat close
-            utils.xps_bone_scale(bone, Vector(scale))
+    def get_pose_applier(self, armature) -> "pose.PoseApplier":
+        key = armature.as_pointer()
+        applier = self.pose_appliers.get(key)
+        if not applier:
+            from . import pose
+            applier = pose.PoseApplier(armature)
+            self.pose_appliers[key] = applier
+        return applier
 
     def transform_character(self, location, scale):
+        # Location and scale have to be converted to Blender space already
         if not self.active_armature:
             return
-        x, y, z = location
-        self.active_armature.location = (x, -z, y)
-        x, y, z = scale
-        self.active_armature.scale = (x, z, y)
+        transaction.current.set(self.active_armature, "location", location)
+        transaction.current.set(self.active_armature, "scale", scale)
+
+    def update_character(self, armature, bones, location, scale, visibility):
+        # Updates an already imported character in place, instead of importing it again
+        self.active_armature = armature
+        self._set_character_visibility(armature.children_recursive, visibility)
+
+        # Identity records keep the current bone values, so start from the rest pose
+        self.get_pose_applier(armature).reset()
+        self.pose_character(bones)
+        self.transform_character(location, scale)
+
+    def tag_item(self, obj, index, key, item_hash):
+        obj[PART_PROPERTY] = "item"
+        obj[ITEM_INDEX_PROPERTY] = index
+        obj[ITEM_KEY_PROPERTY] = key
+        obj[ITEM_HASH_PROPERTY] = item_hash
+
+    def get_items(self):
+        # Returns the armatures and placeholders of all items of an earlier import, grouped by item key and sorted by item index
+        items = {}
+        for obj in sorted(self.get_part_objects("item"), key=lambda o: o.get(ITEM_INDEX_PROPERTY, 0)):
+            items.setdefault(obj.get(ITEM_KEY_PROPERTY), []).append(obj)
+        return items
+
+    def get_part_objects(self, part):
+        return [obj for obj in self.collection.objects if obj.get(PART_PROPERTY) == part]
+
+    def remove_part(self, part):
+        self.remove_objects(self.get_part_objects(part))
+
+    def remove_objects(self, objects):
+        # Removes the objects together with all of their children, e.g. an armature with all meshes of the character
+        to_remove = {}
+        for obj in objects:
+            for o in [obj] + list(obj.children_recursive):
+                to_remove[o.as_pointer()] = o
+        for key, obj in to_remove.items():
+            self.pose_appliers.pop(key, None)
+            transaction.current.discard(obj)
+            PlaceholderHandler.discard(obj)
+        utils.remove_with_data(to_remove.values())
+
+    def set_scene_file(self, filepath, options, hashes):
+        # Remembers which file and options this collection was imported with and the hashes of the imported parts
+        self.collection[SCENE_FILE_PROPERTY] = str(pathlib.Path(filepath).resolve())
+        self.collection[SCENE_OPTIONS_PROPERTY] = json.dumps(options)
+        for part, part_hash in hashes.items():
+            self.collection[SCENE_HASH_PROPERTY.format(part)] = part_hash
+
+    def get_scene_hash(self, part):
+        return self.collection.get(SCENE_HASH_PROPERTY.format(part))
 
     def remove(self):
-        layer_collection = utils.find_layer_collection(self.collection.name)
-        utils.delete_hierarchy(layer_collection)
+        # Deletes everything this import created, including the meshes, materials and images that no other object uses
+        for obj in self.collection.all_objects:
+            transaction.current.discard(obj)
+            PlaceholderHandler.discard(obj)
+        self.pose_appliers.clear()
+        self.imported_characters.clear()
+        removed_count = utils.delete_hierarchy(self.collection)
+        log.info("Removed %s datablocks of scene '%s'", removed_count, self.name)
 
     def set_camera_resolution(self, width, height):
         if height > 10000 or width > 10000:
@@ -259,14 +481,16 @@ class SceneConstructor:
         # XNALara probably defaults to the importing the floor mesh from data/Floor/Floor/Generic_Item.mesh
         # Therefore we just import this by default
 
-        filepath = "data\\Floor\\Floor"
-        self.add_character(filepath, "generic_item", visibility)
+        filepath = GROUND_MODEL_PATH
+        self.add_character(filepath, GROUND_MODEL_NAME, visibility)
         plane_armature = self.active_armature
         if not plane_armature:
             self.error_handler.remove_error_containing_str(f"'{filepath}'")
-            self.error_handler.add_error(f"Could not find ground model, probably due to an unknown XPS installation folder.")
+            self.error_handler.add_error(GROUND_MODEL_ERROR)
             return
 
+        plane_armature[PART_PROPERTY] = "ground"
+
         for obj in plane_armature.children:
             if obj.type != "MESH":
                 continue
@@ -274,6 +498,223 @@ class SceneConstructor:
             mat.shadow_method = 'NONE'
 
 
+def find_scene_collection(filepath):
+    # Returns the collection of an earlier import of this scene file in the current scene
+    filepath = str(pathlib.Path(filepath).resolve())
+    for collection in bpy.context.scene.collection.children:
+        if collection.get(SCENE_FILE_PROPERTY) == filepath:
+            return collection
+    return None
+
+
+def get_scene_collections():
+    return [c for c in bpy.context.scene.collection.children if c.get(SCENE_FILE_PROPERTY)]
+
+
+def is_placeholder(obj):
+    return obj is not None and obj.get(PLACEHOLDER_PROPERTY, False)
+
+
+def load_placeholder(placeholder):
+    # Imports and poses the model of a placeholder empty and replaces the empty with it
+    collection = placeholder.users_collection[0]
+    scene = SceneConstructor(collection.name, collection=collection, scene_controller=placeholder.parent)
+
+    file_directory = placeholder[PLACEHOLDER_DIRECTORY]
+    file_name = placeholder[PLACEHOLDER_NAME]
+
+    # Use the path found during the scene import if the file is still there, otherwise search for it again
+    model_path = pathlib.Path(placeholder[PLACEHOLDER_MODEL_PATH]) if placeholder[PLACEHOLDER_MODEL_PATH] else None
+    if model_path and model_path.is_file():
+        scene.resolved_models[(file_directory, file_name)] = (model_path.parent, model_path.name)
+
+    scene.add_character(file_directory, file_name, True)
+    if not scene.active_armature:
+        return scene.error_handler
+
+    from . import pose
+    scene.pose_character(pose.unpack_bones(placeholder[PLACEHOLDER_BONE_NAMES], placeholder[PLACEHOLDER_BONE_VALUES]))
+
+    # Keep the transformation of the placeholder, in case it was moved after the import
+    scene.active_armature.matrix_basis = placeholder.matrix_basis.copy()
+
+    # The model takes over the place of the placeholder when the scene file gets imported again
+    if placeholder.get(PART_PROPERTY) == "item":
+        scene.tag_item(scene.active_armature, placeholder[ITEM_INDEX_PROPERTY], placeholder[ITEM_KEY_PROPERTY], placeholder[ITEM_HASH_PROPERTY])
+
+    PlaceholderHandler.discard(placeholder)
+    bpy.data.objects.remove(placeholder, do_unlink=True)
+    return scene.error_handler
+
+
+class PlaceholderHandler:
+    # Placeholders that are currently hidden, these get loaded as soon as they are unhidden.
+    # They are tracked by their placeholder id, the object name is only used to find them quickly, as it changes when they get renamed
+    placeholders = {}  # Placeholder id -> object name
+
+    @staticmethod
+    def add(obj):
+        if not obj.get(PLACEHOLDER_ID):
+            # Placeholders of files from older versions don't have an id yet
+            obj[PLACEHOLDER_ID] = uuid.uuid4().hex
+        PlaceholderHandler.placeholders[obj[PLACEHOLDER_ID]] = obj.name
+
+    @staticmethod
+    def discard(obj):
+        PlaceholderHandler.placeholders.pop(obj.get(PLACEHOLDER_ID), None)
+
+    @staticmethod
+    def get_object(placeholder_id):
+        obj = bpy.data.objects.get(PlaceholderHandler.placeholders.get(placeholder_id, ""))
+        if obj is None or obj.get(PLACEHOLDER_ID) != placeholder_id:
+            # The placeholder was renamed
+            obj = next((o for o in bpy.data.objects if o.get(PLACEHOLDER_ID) == placeholder_id), None)
+            if obj is not None:
+                PlaceholderHandler.placeholders[placeholder_id] = obj.name
+        return obj
+
+    @staticmethod
+    def init():
+        bpy.app.handlers.load_post.append(PlaceholderHandler.find_placeholders)
+        bpy.app.handlers.depsgraph_update_post.append(PlaceholderHandler.check_placeholders)
+
+    @staticmethod
+    def unregister():
+        for handlers, handler in ((bpy.app.handlers.load_post, PlaceholderHandler.find_placeholders),
+                                  (bpy.app.handlers.depsgraph_update_post, PlaceholderHandler.check_placeholders)):
+            if handler in handlers:
+                handlers.remove(handler)
+
+    @staticmethod
+    @persistent
+    def find_placeholders(arg1=None, arg2=None):
+        # Collect the placeholders of the loaded file once, so the depsgraph handler only has to check those
+        PlaceholderHandler.placeholders = {}
+        for obj in bpy.data.objects:
+            if is_placeholder(obj):
+                PlaceholderHandler.add(obj)
+
+    @staticmethod
+    @persistent
+    def check_placeholders(scene=None, depsgraph=None):
+        # During a build transaction the placeholders are not hidden yet
+        if not PlaceholderHandler.placeholders or transaction.current.active:
+            return
+
+        # Only placeholders that were updated can have been unhidden. Changing the visibility in the viewport updates the object itself,
+        # but hide_set and the outliner only update the base flags of the scene, then all placeholders have to be checked
+        placeholders = PlaceholderHandler.placeholders
+        candidates = set(placeholders) if depsgraph is None else set()
+        for update in (depsgraph.updates if depsgraph else ()):
+            id_data = update.id
+            if isinstance(id_data, bpy.types.Scene):
+                candidates = set(placeholders)
+                break
+            if isinstance(id_data, bpy.types.Object) and id_data.original.get(PLACEHOLDER_ID) in placeholders:
+                candidates.add(id_data.original[PLACEHOLDER_ID])
+
+        unhidden = []
+        for placeholder_id in candidates:
+            obj = PlaceholderHandler.get_object(placeholder_id)
+            if not is_placeholder(obj):
+                placeholders.pop(placeholder_id, None)
+            elif obj.visible_get():
+                placeholders.pop(placeholder_id, None)
+                unhidden.append(obj.name)
+        if not unhidden:
+            return
+
+        # Importing isn't allowed while the depsgraph is being updated, so load the models right after
+        bpy.app.timers.register(lambda: PlaceholderHandler.load_placeholders(unhidden), first_interval=0)
+
+    @staticmethod
+    def load_placeholders(names):
+        for name in names:
+            obj = bpy.data.objects.get(name)
+            if not is_placeholder(obj):
+                continue
+            error_handler = load_placeholder(obj)
+            if error_handler.has_errors():
+                error_handler.get_error_message()
+        return None
+
+
+class SceneWatcher:
+    # Polls the scene files of earlier imports and updates the imports whenever the files are saved again,
+    # so XPS and Blender can be used side by side.
+    # A change is only applied once the file stayed the same for a whole interval, so half written files are not read
+    interval = 1.0
+    files = {}  # Scene file path -> {"seen": (mtime, size), "applied": (mtime, size)}
+
+    @staticmethod
+    def _get_state(filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    @classmethod
+    def is_watching(cls, filepath=None):
+        if filepath is None:
+            return bool(cls.files)
+        return str(pathlib.Path(filepath).resolve()) in cls.files
+
+    @classmethod
+    def start(cls, filepath):
+        filepath = str(pathlib.Path(filepath).resolve())
+        state = cls._get_state(filepath)
+        cls.files[filepath] = {"seen": state, "applied": state}
+        if not bpy.app.timers.is_registered(cls._poll):
+            bpy.app.timers.register(cls._poll, first_interval=cls.interval, persistent=True)
+        log.info("Watching scene file %s", filepath)
+
+    @classmethod
+    def stop(cls, filepath=None):
+        if filepath is None:
+            cls.files.clear()
+        else:
+            cls.files.pop(str(pathlib.Path(filepath).resolve()), None)
+        if not cls.files and bpy.app.timers.is_registered(cls._poll):
+            bpy.app.timers.unregister(cls._poll)
+
+    @classmethod
+    def _poll(cls):
+        for filepath, states in list(cls.files.items()):
+            state = cls._get_state(filepath)
+            if state != states["seen"]:
+                states["seen"] = state
+                continue
+            if state is None or state == states["applied"]:
+                continue
+
+            collection = find_scene_collection(filepath)
+            if not collection:
+                log.info("Stopped watching %s, its imported collection was removed", filepath)
+                cls.files.pop(filepath)
+                continue
+
+            from .import_handler import ImportXPS
+            options = json.loads(collection.get(SCENE_OPTIONS_PROPERTY, "{}"))
+            try:
+                importer = ImportXPS(filepath, update_existing=True, **options)
+            except ValueError as e:
+                log.warning("Could not update scene from %s: %s", filepath, e)
+                continue
+            except Exception:
+                # An exception escaping the timer would unregister it, while the panel still shows the files as watched.
+                # The update is tried again on the next poll
+                log.exception("Could not update scene from %s", filepath)
+                continue
+
+            # Only successful updates count as applied, failed ones are retried
+            states["applied"] = state
+            if importer.error_handler.has_errors():
+                importer.error_handler.get_error_message()
+
+        return cls.interval if cls.files else None
+
+
 class ErrorHandler:
     def __init__(self):
         self.errors = []
@@ -281,14 +722,14 @@ class ErrorHandler:
     def add_error(self, error):
         if error not in self.errors:
             self.errors.append(error)
-        print(error)
+        log.error(error)
 
     def get_error_message(self):
         error_msg = "Errors while importing scene:"
         for error in self.errors:
             error_msg += f"\n- {error}"
 
-        print(error_msg)
+        log.error(error_msg)
         return error_msg
     
     def has_errors(self):
@@ -309,6 +750,11 @@ class SettingsHandler:
         # Add the load_settings function to the load_post handler in order to apply the settings as soon as a new file gets loaded
         bpy.app.handlers.load_post.append(SettingsHandler.load_settings)
 
+    # The parsed settings file and its (mtime, size) when it was read.
+    # load_settings runs after every loaded .blend file, so the file is only read again if it changed in the meantime
+    cached_settings = None
+    cached_state = None
+
     @staticmethod
     def save_settings():
         settings = copy.deepcopy(SettingsHandler.structure)
@@ -316,16 +762,36 @@ class SettingsHandler:
             settings[key] = getattr(bpy.context.scene, key)
         with open(utils.settings_file, "w+") as f:
             json.dump(settings, f, indent=4)
+        SettingsHandler.cached_settings = settings
+        SettingsHandler.cached_state = SettingsHandler._get_file_state()
+
+    @staticmethod
+    def _get_file_state():
+        try:
+            stat = utils.settings_file.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def read_settings():
+        state = SettingsHandler._get_file_state()
+        if state is None:
+            return {}
+        if state != SettingsHandler.cached_state:
+            try:
+                with open(utils.settings_file, "r") as f:
+                    SettingsHandler.cached_settings = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning("Could not read the settings file: %s", e)
+                SettingsHandler.cached_settings = {}
+            SettingsHandler.cached_state = state
+        return SettingsHandler.cached_settings
 
     @staticmethod
     @persistent
     def load_settings(arg1=None, arg2=None):
-        if not utils.settings_file.exists():
-            return
-        with open(utils.settings_file, "r") as f:
-            settings = json.load(f)
-        for key, value in settings.items():
-            if not value:
-                return
+        for key, value in SettingsHandler.read_settings().items():
+            if not value or key not in SettingsHandler.structure:
+                continue
             setattr(bpy.context.scene, key, value)
-
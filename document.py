@@ -0,0 +1,123 @@
+# Plain data model of a parsed .scene file. This module must not depend on bpy,
+# so scenes can be parsed, inspected and profiled outside of Blender.
+
+import hashlib
+
+
+class SceneDocument:
+    __slots__ = ('filepath', 'version', 'items', 'camera', 'lights', 'post_processing', 'background', 'sky_dome', 'window_size')
+
+    def __init__(self, filepath, version):
+        self.filepath = filepath
+        self.version = version
+        self.items: list[SceneItem] = []
+        self.camera: SceneCamera = None
+        self.lights: list[SceneLight] = []
+        self.post_processing: PostProcessing = None
+        self.background: Background = None
+        self.sky_dome: SkyDome = None
+        self.window_size: WindowSize = None
+
+
+class SceneItem:
+    __slots__ = ('index', 'name', 'path', 'visibility', 'scale', 'bone_count', 'bones', 'location', 'accessories', 'secondary_accessories', 'glow_colors')
+
+    def __init__(self, index, name, path, visibility, scale):
+        self.index = index
+        self.name = name
+        self.path = path
+        self.visibility = visibility
+        self.scale = scale
+        self.bone_count = 0
+        self.bones = None  # Structured array of bin_ops.get_bone_dtype(), None if the bones were skipped
+        self.location = (0, 0, 0)
+        self.accessories: list[str] = []
+        self.secondary_accessories: list[str] = []
+        self.glow_colors = ()
+
+
+class SceneCamera:
+    __slots__ = ('fov', 'target', 'distance', 'rotation_horizontal', 'rotation_vertical')
+
+    def __init__(self, fov, target, distance, rotation_horizontal, rotation_vertical):
+        self.fov = fov
+        self.target = target
+        self.distance = distance
+        self.rotation_horizontal = rotation_horizontal
+        self.rotation_vertical = rotation_vertical
+
+
+class SceneLight:
+    __slots__ = ('index', 'direction', 'intensity', 'color', 'shadow_depth')
+
+    def __init__(self, index, direction, intensity, color, shadow_depth):
+        self.index = index
+        self.direction = direction
+        self.intensity = intensity
+        self.color = color
+        self.shadow_depth = shadow_depth
+
+
+class PostProcessing:
+    __slots__ = ('enabled', 'brightness', 'gamma', 'contrast', 'saturation')
+
+    def __init__(self, enabled, brightness, gamma, contrast, saturation):
+        self.enabled = enabled  # None for versions that don't store this flag
+        self.brightness = brightness
+        self.gamma = gamma
+        self.contrast = contrast
+        self.saturation = saturation
+
+
+class Background:
+    __slots__ = ('ground_visibility', 'ground_texture_path', 'color', 'texture_path', 'texture_type', 'hud_texture_path')
+
+    def __init__(self, ground_visibility, ground_texture_path):
+        self.ground_visibility = ground_visibility
+        self.ground_texture_path = ground_texture_path
+        self.color = None
+        self.texture_path = ""
+        self.texture_type = ""  # Image scale setting: (Fit, Stretch, Crop, Center)
+        self.hud_texture_path = ""
+
+
+class SkyDome:
+    __slots__ = ('visible', 'type', 'rotation', 'elevation')
+
+    def __init__(self, visible, type, rotation, elevation):
+        self.visible = visible
+        self.type = type
+        self.rotation = rotation
+        self.elevation = elevation
+
+
+class WindowSize:
+    __slots__ = ('is_maximized', 'width', 'height')
+
+    def __init__(self, is_maximized, width, height):
+        self.is_maximized = is_maximized
+        self.width = width
+        self.height = height
+
+
+def get_item_key(item: SceneItem):
+    # Identifies the model of an item, items with the same key can be updated into each other
+    return f"{item.path}|{item.name}"
+
+
+def hash_item(item: SceneItem):
+    # Hash of everything that is stored for an item, used to find the items that changed since the last import
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((item.name, item.path, item.visibility, item.scale, item.location,
+                   item.accessories, item.secondary_accessories, item.glow_colors)).encode())
+    if item.bones is not None:
+        h.update("\n".join(item.bones['name'].tolist()).encode())
+        for field in ('rot', 'loc', 'scale'):
+            h.update(item.bones[field].tobytes())
+    return h.hexdigest()
+
+
+def hash_objects(*objects):
+    # Hash of the values of the given document objects, e.g. all lights or the camera and window size
+    values = [[getattr(obj, attr) for attr in obj.__slots__] for obj in objects if obj is not None]
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
@@ -1,285 +1,524 @@
-import binascii
-import io
+import re
+import time
 import pathlib
+import contextlib
 
-from . import bin_ops
+import bpy
+
+from . import animation
+from . import conversion
 from . import core
+from . import document
+from . import instrumentation
+from . import logger
+from . import memory
+from . import parser
+from . import pose
+from . import transaction
+from . import utils
+from .core import HIDDEN_MODELS_IMPORT, HIDDEN_MODELS_PLACEHOLDER, POSE_MODE_APPLY, POSE_MODE_KEYFRAMES
+from .document import SceneDocument
 
+log = logger.get_logger("import_handler")
 
-class ImportXPS:
-    latest_supported_version = (1, 21)
-    latest_supported_version_str = '.'.join(str(x) for x in latest_supported_version)
+# Numbered scene files like pose_0001.scene: (prefix, number)
+SEQUENCE_PATTERN = re.compile(r"^(.*?)(\d+)$")
 
-    def __init__(self, filepath, import_models=True, import_lights=True, import_camera=True, import_ground=True, exclude_hidden_models=False):
+
+class ImportXPS:
+    def __init__(self, filepath, import_models=True, import_lights=True, import_camera=True, import_ground=True, hidden_models=HIDDEN_MODELS_IMPORT, check_only=False,
+                 profile=False, update_existing=False, use_model_cache=True, low_memory=False,
+                 defer_updates=True):
         self.filepath = filepath
         self.import_models = import_models
         self.import_lights = import_lights
         self.import_camera = import_camera
         self.import_ground = import_ground
-        self.exclude_hidden_models = exclude_hidden_models
-
-        self.io_stream: io.BytesIO = None
-
-        filepath = pathlib.Path(filepath)
-        self.scene = core.SceneConstructor(filepath.stem)
-
-        self.version = (0, 0)
-
-        self.verbose = True
-
-        self._read_file()
-
-    def _print(self, *text):
-        if self.verbose:
-            print(*text)
-
-    def _read_file(self):
-        print(f"\nInfo: Reading file: {self.filepath}")
-
-        print("Info: Getting IO stream..")
-        self.io_stream = self._get_io_stream()
-
-        print("Info: Reading file header..")
-        self._read_header()
-
-        print("Info: Reading items..")
-        self._read_items()
-
-        self._print()
-        print("Info: Reading camera..")
-        self._read_camera()
-
-        self._print()
-        print("Info: Reading lights..")
-        self._read_lights()
-
-        print("Info: Reading post processing..")
-        self._read_post_processing()
-
-        print("Info: Reading background..")
-        self._read_background()
-
-        print("Info: Reading sky dome..")
-        self._read_sky_dome()
-
-        print("Info: Reading window size..")
-        self._read_window_size()
-
-    def _get_io_stream(self):
-        with open(self.filepath, 'rb') as file:
-            io_stream = io.BytesIO(file.read())
-        return io_stream
-
-    def _read_header(self):
-        # Read version
-        version_major = bin_ops.readUInt16(self.io_stream)
-        version_minor = bin_ops.readUInt16(self.io_stream)
-        self.version = (version_major, version_minor)
-        print(f"Info: Version: {self.version}")
-
-        if self.version < self.latest_supported_version:
-            raise ValueError(f"Unsupported file version {self.version}. Only file version {self.latest_supported_version_str} and above are supported.")
-
-    def _read_items(self):
-        # Read item count
-        item_count = bin_ops.readUInt32(self.io_stream)
-        self._print(f"Info: Item count: {item_count}")
-
-        # Read items
-        for i in range(item_count):
-            # Read the item info
-            item_name = bin_ops.readString(self.io_stream)
-            item_path = bin_ops.readString(self.io_stream)
-            self._print(f"Info: Item {i} type: '{item_name}'")
-            self._print(f"Info: Item {i} path: '{item_path}'")
-
-            # Read the item visibility
-            item_visibility = bin_ops.readByte(self.io_stream)
-            self._print(f"Info: Item {i} visibility: {item_visibility}")
-
-            # Read the item scale
-            if self.version >= (1, 8):
-                item_scale = (bin_ops.readSingle(self.io_stream, print_hex=False),
-                              bin_ops.readSingle(self.io_stream, print_hex=False),
-                              bin_ops.readSingle(self.io_stream, print_hex=False))
-            else:
-                scale = bin_ops.readSingle(self.io_stream)
-                item_scale = (scale, scale, scale)
-            self._print(f"Info: Item {i} scale: {item_scale}")
-
-            # Add the character to the scene
-            self.scene.active_armature = None
-            if self.import_models:
-                if item_visibility or not self.exclude_hidden_models:
-                    self.scene.add_character(item_path, item_name, item_visibility)
-
-            # Read the bone data
-            bone_count = bin_ops.readUInt32(self.io_stream, print_hex=False)
-            print(f"Info: Item {i} bone count: {bone_count}")
-            for _ in range(bone_count):
-                bone_name = bin_ops.readString(self.io_stream)
-                rotation = (round(bin_ops.readSingle(self.io_stream), 4),
-                            round(bin_ops.readSingle(self.io_stream), 4),
-                            round(bin_ops.readSingle(self.io_stream), 4))
-                location = (round(bin_ops.readSingle(self.io_stream), 4),
-                            round(bin_ops.readSingle(self.io_stream), 4),
-                            round(bin_ops.readSingle(self.io_stream), 4))
-                scale = (round(bin_ops.readSingle(self.io_stream), 4),
-                         round(bin_ops.readSingle(self.io_stream), 4),
-                         round(bin_ops.readSingle(self.io_stream), 4))
-                # self._print(f"Info: Bone name: '{bone_name}'")
-                # self._print(f"Info: Bone rot: {rotation}, loc: {location}, scale: {scale}")
-
-                self.scene.pose_character(bone_name, rotation, location, scale)
-
-            # Read character location
-            item_location = (bin_ops.readSingle(self.io_stream),
-                             bin_ops.readSingle(self.io_stream),
-                             bin_ops.readSingle(self.io_stream))
-            self._print(f"Info: Item {i} location: {item_location}")
-
-            # Set character location
-            self.scene.transform_character(item_location, item_scale)
-
-            # Skip all the accessorises
-            accessory_count = bin_ops.readUInt32(self.io_stream)
-            for _ in range(accessory_count):
-                name = bin_ops.readString(self.io_stream)
-                self.io_stream.read(1)  # Skip one byte
-                self._print(f"Info: Item {i} accessory name: '{name}'")
-
-            # Skip all secondary accessories
-            accessory_count = bin_ops.readUInt16(self.io_stream)
-            for _ in range(accessory_count):
-                name = bin_ops.readString(self.io_stream)
-                self.io_stream.read(1)  # Skip one byte
-                self._print(f"Info: Item {i} secondary accessory name: '{name}'")
-
-            # Skip the glow information
-            if self.version >= (1, 11):
-                for j in range(6):
-                    color = bin_ops.readSingle(self.io_stream, round_to=2)
-                    self._print(f"Info: Item {i} glow color {j}: {color}")
-
-    def _read_camera(self):
-        camera_fov = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Camera fov: {camera_fov}")
-
-        camera_target = (bin_ops.readSingle(self.io_stream),
-                         bin_ops.readSingle(self.io_stream),
-                         bin_ops.readSingle(self.io_stream))
-        self._print(f"Info: Camera target: {camera_target}")
-
-        camera_distance = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Camera distance: {camera_distance}")
-
-        camera_rotation_horizontal = bin_ops.readSingle(self.io_stream)
-        camera_rotation_vertical = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Camera rotation: {camera_rotation_horizontal}, {camera_rotation_vertical}")
-
-        if self.import_camera:
-            self.scene.create_camera(camera_fov, camera_target, camera_distance, camera_rotation_horizontal, camera_rotation_vertical)
-
-    def _read_lights(self):
-        self.io_stream.read(4)  # Skip one single
-        for i in range(1, 4):
-            # Skip one byte if it's not the first light
-            if self.version >= (1, 30):
-                if i != 1:
-                    self.io_stream.read(1)
-
-            light_direction = (bin_ops.readSingle(self.io_stream, round_to=6),
-                               bin_ops.readSingle(self.io_stream, round_to=6),
-                               bin_ops.readSingle(self.io_stream, round_to=6))
-            self._print(f"Info: Light {i} direction: {light_direction}")
-
-            light_intensity = 1
-            if self.version >= (1, 2):
-                light_intensity = bin_ops.readSingle(self.io_stream, round_to=2)
-            self._print(f"Info: Light {i} intensity: {light_intensity}")
-
-            light_color = (bin_ops.readByte(self.io_stream),
-                           bin_ops.readByte(self.io_stream),
-                           bin_ops.readByte(self.io_stream))
-            self._print(f"Info: Light {i} color: {light_color}")
-
-            self.light_shadow_depth = bin_ops.readSingle(self.io_stream, round_to=2)
-            self._print(f"Info: Light {i} shadow depth: {self.light_shadow_depth}")
-
-            if self.import_lights:
-                self.scene.create_light(i, light_direction, light_intensity, light_color, self.light_shadow_depth)
-
-    def _read_post_processing(self):
-        if self.version < (1, 9):
+        self.hidden_models = hidden_models
+        self.check_only = check_only
+        self.update_existing = update_existing
+        self.use_model_cache = use_model_cache
+        self.low_memory = low_memory
+
+        # Queue transforms, parenting, poses and visibility changes and apply them all at once after building the scene,
+        # instead of updating the dependency graph after every item
+        self.defer_updates = defer_updates
+
+        # Memory use and datablock counts before and after the import, only collected in the low memory mode
+        self.memory_report = None
+
+        # Set if an earlier import of this file was updated instead of creating a new one
+        self.updated = False
+        self.update_counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+        # Timings and counters of this import, only collected if profiling is enabled
+        self.instrumentation = instrumentation.Instrumentation() if profile else instrumentation.NULL
+
+        with instrumentation.activate(self.instrumentation):
+            self._import()
+
+        if profile:
+            self.report_file = pathlib.Path(self.filepath).with_suffix(".import_report.json")
+            extra = {"memory": self.memory_report} if self.memory_report else {}
+            self.instrumentation.write_json(self.report_file, scene=str(self.filepath), **extra)
+            log.info("Import timings:\n%s", self.instrumentation.format_summary())
+            log.info("Saved import report to %s", self.report_file)
+
+    def _import(self):
+        # Parse the whole file first, this doesn't touch Blender at all
+        with self.instrumentation.timer("parse"):
+            self.document: SceneDocument = parser.parse_scene(self.filepath)
+
+        # Only search for the models and report the missing ones, without creating anything in Blender
+        if self.check_only:
+            self.scene = None
+            self.error_handler = core.ErrorHandler()
+            with self.instrumentation.timer("check models"):
+                self._check_models()
             return
 
-        if self.version > (1, 21):
-            use_post_processing = bin_ops.readByte(self.io_stream)
-            self._print(f"Info: Use post processing?: {use_post_processing}")
-
-        brightness = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Brightness: {brightness}")
-
-        gamma = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Gamma: {gamma}")
-
-        contrast = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Contrast: {contrast}")
-
-        saturation = bin_ops.readSingle(self.io_stream)
-        self._print(f"Info: Saturation: {saturation}")
-
-        self.io_stream.read(1)  # Skip 1 bytes
-
-        if self.version > (1, 21):
-            self.io_stream.read(4)  # Skip 4 bytes
+        if self.low_memory:
+            datablocks_pre = utils.get_datablock_pointers()
+            datablock_counts_pre = utils.get_datablock_counts()
+            memory_pre, _ = memory.get_memory_usage()
+
+        # Update the collection of an earlier import of the same file, if there is one
+        collection = core.find_scene_collection(self.filepath) if self.update_existing else None
+        if collection:
+            with self.instrumentation.timer("update"), self._build_transaction():
+                self.scene = core.SceneConstructor(collection.name, collection=collection, use_model_cache=self.use_model_cache)
+                self.error_handler = self.scene.error_handler
+                self.updated = True
+
+                self._update_scene()
+        else:
+            with self.instrumentation.timer("build"), self._build_transaction():
+                self.scene = core.SceneConstructor(pathlib.Path(self.filepath).stem, use_model_cache=self.use_model_cache)
+                self.error_handler = self.scene.error_handler
+
+                self._build_scene()
+
+        self.scene.set_scene_file(self.filepath, self.get_options(), self._get_hashes())
+
+        if self.low_memory:
+            with self.instrumentation.timer("purge orphans"):
+                self._purge_orphans(datablocks_pre, datablock_counts_pre, memory_pre)
+
+    def _build_transaction(self):
+        return transaction.build() if self.defer_updates else contextlib.nullcontext()
+
+    @property
+    def version(self):
+        return self.document.version
+
+    def get_options(self):
+        # The options that are needed to update this import later on
+        return {
+            "import_models": self.import_models,
+            "import_lights": self.import_lights,
+            "import_camera": self.import_camera,
+            "import_ground": self.import_ground,
+            "hidden_models": self.hidden_models,
+            "use_model_cache": self.use_model_cache,
+            "low_memory": self.low_memory,
+        }
+
+    def _purge_orphans(self, datablocks_pre, datablock_counts_pre, memory_pre):
+        # Removes the datablocks that were created during the import but are not used by anything,
+        # e.g. the data of the deleted character collections and of the ground model
+        purged_count = utils.purge_new_orphans(datablocks_pre)
+        self.instrumentation.count("orphans_purged", purged_count)
+
+        memory_post, memory_peak = memory.get_memory_usage()
+        self.memory_report = {
+            "memory_before": memory_pre,
+            "memory_after": memory_post,
+            "memory_peak": memory_peak,
+            "orphans_purged": purged_count,
+            "datablocks_before": datablock_counts_pre,
+            "datablocks_after": utils.get_datablock_counts(),
+        }
+        log.info("Purged %s orphaned datablocks. %s", purged_count, self.get_memory_summary())
+
+    def get_memory_summary(self):
+        report = self.memory_report
+        if not report:
+            return ""
+        added = sum(report["datablocks_after"].values()) - sum(report["datablocks_before"].values())
+        return (f"Memory: {memory.format_bytes(report['memory_before'])} before, {memory.format_bytes(report['memory_after'])} after, "
+                f"{memory.format_bytes(report['memory_peak'])} peak. Datablocks: {added:+} ({report['orphans_purged']} orphans purged)")
+
+    def _get_hashes(self):
+        hashes = {}
+        if self.import_lights:
+            hashes["lights"] = document.hash_objects(*self.document.lights)
+        if self.import_camera:
+            hashes["camera"] = document.hash_objects(self.document.camera, self.document.window_size)
+        return hashes
+
+    def _get_item_mode(self, item):
+        # Returns "import" or "placeholder" for items that will be added to the scene, otherwise None
+        if not self.import_models:
+            return None
+        if item.visibility or self.hidden_models == HIDDEN_MODELS_IMPORT:
+            return "import"
+        if self.hidden_models == HIDDEN_MODELS_PLACEHOLDER:
+            return "placeholder"
+        return None
+
+    def _get_models(self, items=None, ground=True):
+        # Get all (path, name) pairs of models that will be imported
+        models = []
+        for item in self.document.items if items is None else items:
+            if self._get_item_mode(item):
+                models.append((item.path, item.name))
+        if ground and self.import_ground:
+            models.append((core.GROUND_MODEL_PATH, core.GROUND_MODEL_NAME))
+        return models
+
+    def _check_models(self):
+        log.info("Checking models..")
+        models = self._get_models()
+        resolved_models = utils.resolve_models(models)
+        for (file_directory, file_name), (character_folder, mesh_file) in resolved_models.items():
+            error = core.get_model_error(file_directory, file_name, character_folder, mesh_file)
+            if not error:
+                continue
+            if (file_directory, file_name) == (core.GROUND_MODEL_PATH, core.GROUND_MODEL_NAME):
+                error = core.GROUND_MODEL_ERROR
+            self.error_handler.add_error(error)
+        self.model_count = len(resolved_models)
+
+    def _build_scene(self):
+        timer = self.instrumentation.timer
+        log.info("Building scene..")
+
+        log.info("Searching models..")
+        with timer("resolve models"):
+            self.scene.resolve_models(self._get_models())
+
+        log.info("Building items..")
+        with timer("items"):
+            self._build_items(self.document.items)
+
+        log.info("Building camera..")
+        with timer("camera"):
+            self._build_camera()
+
+        log.info("Building lights..")
+        with timer("lights"):
+            self._build_lights()
+
+        log.info("Building ground..")
+        with timer("ground"):
+            self._build_ground()
+
+        log.info("Building window size..")
+        with timer("window size"):
+            self._build_window_size()
+
+    def _update_scene(self):
+        # Only apply what changed since the last import of this file
+        timer = self.instrumentation.timer
+        hashes = self._get_hashes()
+        log.info("Updating existing scene '%s'..", self.scene.collection.name)
+
+        log.info("Updating items..")
+        with timer("items"):
+            self._update_items()
+
+        # The camera and lights are cheap to create, so they are simply created again if anything about them changed
+        if self.import_camera and (self.scene.get_scene_hash("camera") != hashes["camera"] or not self.scene.get_part_objects("camera")):
+            log.info("Updating camera..")
+            with timer("camera"):
+                self.scene.remove_part("camera")
+                self._build_camera()
+                self._build_window_size()
+
+        if self.import_lights and (self.scene.get_scene_hash("lights") != hashes["lights"] or not self.scene.get_part_objects("lights")):
+            log.info("Updating lights..")
+            with timer("lights"):
+                self.scene.remove_part("lights")
+                self._build_lights()
+
+        if self.import_ground and not self.scene.get_part_objects("ground"):
+            log.info("Building ground..")
+            with timer("ground"):
+                self.scene.resolve_models([(core.GROUND_MODEL_PATH, core.GROUND_MODEL_NAME)])
+                self._build_ground()
+
+        counts = self.update_counts
+        log.info("Updated scene: %s added, %s updated, %s removed, %s unchanged items",
+                 counts["added"], counts["updated"], counts["removed"], counts["unchanged"])
+
+    def _update_items(self):
+        timer = self.instrumentation.timer
+        existing = self.scene.get_items()
+        added = []
+        removed = []
+        replaced_count = 0
+
+        locations, scales = self._get_item_transforms(self.document.items)
+        for item, location, scale in zip(self.document.items, locations, scales):
+            # Items with the same model are matched in the order they appear in the file
+            key = document.get_item_key(item)
+            candidates = existing.get(key)
+            obj = candidates.pop(0) if candidates else None
+
+            mode = self._get_item_mode(item)
+            if not mode:
+                if obj:
+                    removed.append(obj)
+                continue
+            if not obj:
+                added.append(item)
+                continue
+
+            item_hash = document.hash_item(item)
+            if obj.get(core.ITEM_HASH_PROPERTY) == item_hash:
+                obj[core.ITEM_INDEX_PROPERTY] = item.index
+                self.update_counts["unchanged"] += 1
+                continue
+
+            # Characters are updated in place. Placeholders, and characters that become placeholders, are created again
+            if mode == "import" and obj.type == "ARMATURE":
+                item_folder = item.path.split("\\")[-1]
+                with timer(f"Item {item.index}: {item_folder}"):
+                    self.scene.update_character(obj, item.bones, location, scale, item.visibility)
+                    self.scene.tag_item(obj, item.index, key, item_hash)
+                self.update_counts["updated"] += 1
+                continue
+
+            removed.append(obj)
+            added.append(item)
+            replaced_count += 1
+
+        # Everything that is left over was deleted from the scene file
+        for objects in existing.values():
+            removed += objects
+
+        self.update_counts["updated"] += replaced_count
+        self.update_counts["added"] = len(added) - replaced_count
+        self.update_counts["removed"] = len(removed) - replaced_count
+
+        with timer("remove"):
+            self.scene.remove_objects(removed)
+
+        if added:
+            with timer("resolve models"):
+                self.scene.resolve_models(self._get_models(added, ground=False))
+            self._build_items(added)
+
+    def _build_items(self, items):
+        timer = self.instrumentation.timer
+        locations, scales = self._get_item_transforms(items)
+        for item, location, scale in zip(items, locations, scales):
+            item_folder = item.path.split("\\")[-1]
+            with timer(f"Item {item.index}: {item_folder}"):
+                # Add the character to the scene
+                self.scene.active_armature = None
+                mode = self._get_item_mode(item)
+                if mode == "import":
+                    with timer("import"):
+                        self.scene.add_character(item.path, item.name, item.visibility)
+                elif mode == "placeholder":
+                    with timer("placeholder"):
+                        placeholder = self.scene.add_placeholder(item.path, item.name, item.bones, location, scale)
+                        self.scene.tag_item(placeholder, item.index, document.get_item_key(item), document.hash_item(item))
+                    continue
+
+                # Pose all bones of the character
+                with timer("pose"):
+                    self.scene.pose_character(item.bones)
+
+                # Set character location
+                with timer("transform"):
+                    self.scene.transform_character(location, scale)
+
+                # Remember the item, so it can be updated by a later import of the same file
+                if self.scene.active_armature:
+                    self.scene.tag_item(self.scene.active_armature, item.index, document.get_item_key(item), document.hash_item(item))
+
+    @staticmethod
+    def _get_item_transforms(items):
+        # Converts the locations and scales of all items to Blender space at once
+        locations = conversion.location_to_blender([item.location for item in items])
+        scales = conversion.scale_to_blender([item.scale for item in items])
+        return locations, scales
+
+    def _build_camera(self):
+        camera = self.document.camera
+        if self.import_camera:
+            target = conversion.location_to_blender(camera.target)
+            self.scene.create_camera(camera.fov, target, camera.distance, camera.rotation_horizontal, camera.rotation_vertical)
 
-    def _read_background(self):
-        ground_visibility = bin_ops.readByte(self.io_stream)
-        ground_texture_path = bin_ops.readString(self.io_stream)
-        self._print(f"Info: Display ground?: {ground_visibility}")
-        self._print(f"Info: Ground texture path: {ground_texture_path}")
+    def _build_lights(self):
+        if not self.import_lights:
+            return
+        lights = self.document.lights
+        directions = conversion.location_to_blender([light.direction for light in lights])
+        for light, direction in zip(lights, directions):
+            self.scene.create_light(light.index, direction, light.intensity, light.color, light.shadow_depth)
 
+    def _build_ground(self):
         if self.import_ground:
-            self.scene.create_ground(ground_texture_path, ground_visibility)
-
-        if self.version >= (1, 1):
-            background_color = (bin_ops.readByte(self.io_stream),
-                                bin_ops.readByte(self.io_stream),
-                                bin_ops.readByte(self.io_stream))
-            self._print(f"Info: Background color: {background_color}")
-
-        background_texture_path = bin_ops.readString(self.io_stream)
-        self._print(f"Info: Background texture path: {background_texture_path}")
-
-        if self.version > (1, 21):
-            background_texture_type = bin_ops.readString(self.io_stream)  # Image scale setting: (Fit, Stretch, Crop, Center)
-            self._print(f"Info: Background texture type: {background_texture_type}")
-
-            hud_texture_path = bin_ops.readString(self.io_stream)
-            self._print(f"Info: HUD texture path: {hud_texture_path}")
-
-    def _read_sky_dome(self):
-        if self.version >= (1, 6):
-            display_sky_dome = bin_ops.readByte(self.io_stream)
-            self._print(f"Info: Display sky dome?: {display_sky_dome}")
-
-            sky_dome_type = bin_ops.readString(self.io_stream)
-            self._print(f"Info: Sky dome type: {sky_dome_type}")
-
-            sky_dome_rotation = bin_ops.readSingle(self.io_stream)
-            self._print(f"Info: Sky dome rotation: {sky_dome_rotation}")
-
-            sky_dome_elevation = bin_ops.readSingle(self.io_stream)
-            self._print(f"Info: Sky dome elevation: {sky_dome_elevation}")
-
-    def _read_window_size(self):
-        if self.version >= (1, 7):
-            is_maximized = bin_ops.readByte(self.io_stream)
-            self.window_width = bin_ops.readUInt32(self.io_stream)
-            self.window_height = bin_ops.readUInt32(self.io_stream)
-            self._print(f"Info: Is maximized?: {is_maximized}")
-            self._print(f"Info: Window size: {self.window_width}x{self.window_height}")
-
-            if self.import_camera:
-                self.scene.set_camera_resolution(self.window_width, self.window_height)
+            background = self.document.background
+            self.scene.create_ground(background.ground_texture_path, background.ground_visibility)
+
+    def _build_window_size(self):
+        window_size = self.document.window_size
+        if window_size and self.import_camera:
+            self.scene.set_camera_resolution(window_size.width, window_size.height)
+
+
+def find_scene_sequence(filepath):
+    # Returns all scene files of the numbered sequence the file belongs to, sorted by their number.
+    # pose_0001.scene, pose_0002.scene, ... all belong to the sequence "pose_"
+    filepath = pathlib.Path(filepath)
+    match = SEQUENCE_PATTERN.match(filepath.stem)
+    if not match:
+        return [filepath]
+
+    prefix = match.group(1)
+    files = []
+    for file in filepath.parent.iterdir():
+        if file.suffix.lower() != ".scene":
+            continue
+        file_match = SEQUENCE_PATTERN.match(file.stem)
+        if file_match and file_match.group(1) == prefix:
+            files.append((int(file_match.group(2)), file))
+    return [file for _, file in sorted(files)]
+
+
+class ImportXPSSequence:
+    # Imports a sequence of scene files as one animation.
+    # The characters, lights, camera and ground are imported from the first file, the poses and transformations of the characters
+    # in all files become keyframes, with one Action per armature. Items are matched between the files like in an update import
+    def __init__(self, filepaths, frame_start=1, frame_step=1, import_lights=True, import_camera=True, import_ground=True, use_model_cache=True):
+        self.filepaths = [str(filepath) for filepath in filepaths]
+        self.frames = [frame_start + i * frame_step for i in range(len(self.filepaths))]
+        if not self.filepaths:
+            raise ValueError("The scene sequence doesn't contain any files!")
+
+        start = time.perf_counter()
+        log.info("Importing scene sequence of %s files, starting with %s", len(self.filepaths), self.filepaths[0])
+
+        # Hidden models are imported as well, since they might be visible in later frames
+        self.importer = ImportXPS(self.filepaths[0], import_lights=import_lights, import_camera=import_camera, import_ground=import_ground,
+                                  hidden_models=HIDDEN_MODELS_IMPORT, use_model_cache=use_model_cache)
+        self.scene = self.importer.scene
+        self.error_handler = self.importer.error_handler
+
+        self.animations = {}  # Armature pointer -> animation.ArmatureAnimation
+        self._read_frames()
+        self._write_actions()
+        log.info("Imported scene sequence in %.2fs", time.perf_counter() - start)
+
+    def _read_frames(self):
+        armatures = self.scene.get_items()
+        for frame_index, filepath in enumerate(self.filepaths):
+            scene_document = self.importer.document if frame_index == 0 else parser.parse_scene(filepath)
+            items = scene_document.items
+            locations, scales = ImportXPS._get_item_transforms(items)
+
+            # Items with the same model are matched in the order they appear in the file
+            occurrences = {}
+            for item, location, scale in zip(items, locations, scales):
+                key = document.get_item_key(item)
+                occurrence = occurrences.get(key, 0)
+                occurrences[key] = occurrence + 1
+                candidates = armatures.get(key, [])
+                if occurrence >= len(candidates) or candidates[occurrence].type != "ARMATURE":
+                    continue
+
+                armature = candidates[occurrence]
+                armature_animation = self.animations.get(armature.as_pointer())
+                if not armature_animation:
+                    armature_animation = animation.ArmatureAnimation(armature, self.scene.get_pose_applier(armature), len(self.filepaths))
+                    self.animations[armature.as_pointer()] = armature_animation
+                armature_animation.set_frame(frame_index, item.bones, location, scale)
+
+    def _write_actions(self):
+        name = pathlib.Path(self.filepaths[0]).stem
+        for armature_animation in self.animations.values():
+            armature_animation.write(self.frames, f"{armature_animation.armature.name} {name}")
+
+        scene = bpy.context.scene
+        scene.frame_start = self.frames[0]
+        scene.frame_end = self.frames[-1]
+        scene.frame_set(self.frames[0])
+
+
+def find_pose_files(directory):
+    # Returns all .pose files in the folder, numbered files are sorted by their number
+    def sort_key(file):
+        match = SEQUENCE_PATTERN.match(file.stem)
+        if match:
+            return match.group(1).lower(), int(match.group(2))
+        return file.stem.lower(), -1
+
+    files = [file for file in pathlib.Path(directory).iterdir() if file.suffix.lower() == ".pose" and file.is_file()]
+    return sorted(files, key=sort_key)
+
+
+class ImportXPSPose:
+    # Applies XPS .pose files to an armature, with the same bone conversion as the poses in scene files.
+    # A single pose is applied directly, a whole folder of poses becomes keyframes or pose library entries
+    def __init__(self, armature, filepaths, mode=POSE_MODE_APPLY, frame_start=1, frame_step=1):
+        if not armature or armature.type != "ARMATURE":
+            raise ValueError("Please select the armature that should be posed!")
+        self.filepaths = [str(filepath) for filepath in filepaths]
+        if not self.filepaths:
+            raise ValueError("No .pose files found!")
+
+        self.armature = armature
+        self.applier = pose.PoseApplier(armature)
+        self.missing_bones = set()
+        self.actions = []
+
+        start = time.perf_counter()
+        if mode == POSE_MODE_APPLY:
+            self._apply(self.filepaths[0])
+        elif mode == POSE_MODE_KEYFRAMES:
+            self._add_keyframes(frame_start, frame_step)
+        else:
+            self._add_library_entries()
+
+        if self.missing_bones:
+            log.warning("%s bones of the pose files were not found in armature '%s'", len(self.missing_bones), armature.name)
+        log.info("Applied %s pose files in %.2fs", len(self.filepaths), time.perf_counter() - start)
+
+    def _read_pose(self, filepath):
+        bones = parser.parse_pose(filepath)
+        self.missing_bones.update(name for name in bones['name'].tolist() if name not in self.applier.bone_indices)
+        return bones
+
+    def _apply(self, filepath):
+        # Bones that are not in the pose file go back to their rest pose, like in XPS
+        self.applier.apply(self._read_pose(filepath), from_rest=True)
+
+    def _add_keyframes(self, frame_start, frame_step):
+        frames = [frame_start + i * frame_step for i in range(len(self.filepaths))]
+        armature_animation = animation.ArmatureAnimation(self.armature, self.applier, len(self.filepaths))
+        for frame_index, filepath in enumerate(self.filepaths):
+            armature_animation.set_frame(frame_index, self._read_pose(filepath))
+
+        name = pathlib.Path(self.filepaths[0]).parent.name
+        self.actions.append(armature_animation.write(frames, f"{self.armature.name} {name}"))
+
+        scene = bpy.context.scene
+        scene.frame_start = frames[0]
+        scene.frame_end = frames[-1]
+        scene.frame_set(frames[0])
+
+    def _add_library_entries(self):
+        # Every pose becomes its own Action, marked as asset so it shows up in the pose library.
+        # All bones are keyed, so applying an entry always results in exactly the pose of the file
+        for filepath in self.filepaths:
+            armature_animation = animation.ArmatureAnimation(self.armature, self.applier, 1)
+            armature_animation.set_frame(0, self._read_pose(filepath))
+            action = armature_animation.write([1], pathlib.Path(filepath).stem, assign=False, skip_rest=False)
+            action.use_fake_user = True
+            if hasattr(action, "asset_mark"):
+                action.asset_mark()
+            self.actions.append(action)
@@ -0,0 +1,104 @@
+# Command line scene inspector, runs without Blender.
+#
+# Usage (from the folder containing the addon folder):
+#   python -m <addon folder>.inspector <scene files, folders or glob patterns> [--format json|ndjson] [--fast] [--output FILE]
+#
+# Dumps everything stored in the scene files as JSON: the referenced models with their visibility, bones and accessories,
+# the camera, lights, background and window size. With --fast the bones are skipped and only counted,
+# then numpy is never imported. With --format ndjson every scene is written as one line as soon as it is parsed.
+
+import sys
+import json
+import logging
+import argparse
+
+from . import logger
+from . import parser
+from .scene_files import collect_scene_files, run_cli
+
+
+def _slots_to_dict(obj):
+    if obj is None:
+        return None
+    return {attr: getattr(obj, attr) for attr in obj.__slots__}
+
+
+def item_to_dict(item, include_bones=True):
+    data = {attr: getattr(item, attr) for attr in item.__slots__ if attr != 'bones'}
+    if include_bones and item.bones is not None:
+        names = item.bones['name'].tolist()
+        values = {field: item.bones[field].tolist() for field in ('rot', 'loc', 'scale')}
+        data['bones'] = [{"name": name, **{field: values[field][i] for field in values}} for i, name in enumerate(names)]
+    return data
+
+
+def document_to_dict(document, include_bones=True):
+    return {
+        "filepath": str(document.filepath),
+        "version": ".".join(str(x) for x in document.version),
+        "items": [item_to_dict(item, include_bones) for item in document.items],
+        "camera": _slots_to_dict(document.camera),
+        "lights": [_slots_to_dict(light) for light in document.lights],
+        "post_processing": _slots_to_dict(document.post_processing),
+        "background": _slots_to_dict(document.background),
+        "sky_dome": _slots_to_dict(document.sky_dome),
+        "window_size": _slots_to_dict(document.window_size),
+    }
+
+
+def inspect_scene(filepath, fast=False):
+    # Returns the scene as a JSON compatible dict, or the error if it can't be read
+    try:
+        document = parser.parse_scene(filepath, read_bones=not fast)
+    except (OSError, ValueError) as e:
+        return {"filepath": str(filepath), "error": str(e)}
+    return document_to_dict(document, include_bones=not fast)
+
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(description="Dumps the content of XPS .scene files as JSON, without Blender.")
+    argument_parser.add_argument("inputs", nargs="+", help="Scene files, folders containing scene files or glob patterns")
+    argument_parser.add_argument("--format", choices=("json", "ndjson"), default="json", help="One JSON array of all scenes, or one line per scene (default json)")
+    argument_parser.add_argument("--fast", action="store_true", help="Skip the bone data, only the bone counts are reported")
+    argument_parser.add_argument("--indent", type=int, help="Indentation of the json format")
+    argument_parser.add_argument("--output", help="Write to this file instead of stdout")
+    args = argument_parser.parse_args(argv)
+
+    # Keep stdout clean for the JSON output, only warnings and errors go to stderr
+    logger.console_handler.setStream(sys.stderr)
+    logger.set_level(logging.WARNING)
+    return run_cli(inspect_files, args)
+
+
+def inspect_files(args):
+    scene_files = collect_scene_files(args.inputs)
+    if not scene_files:
+        print("No .scene files found.", file=sys.stderr)
+        return 1
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    try:
+        if args.format == "ndjson":
+            for filepath in scene_files:
+                data = inspect_scene(filepath, fast=args.fast)
+                failed += "error" in data
+                out.write(json.dumps(data) + "\n")
+                out.flush()
+        else:
+            scenes = [inspect_scene(filepath, fast=args.fast) for filepath in scene_files]
+            failed = sum("error" in data for data in scenes)
+            json.dump(scenes, out, indent=args.indent)
+            out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if failed:
+        print(f"{failed} of {len(scene_files)} scenes could not be read.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+# Lightweight import instrumentation: nested timers and counters.
+# The active instrumentation is module-global, so hot code can use it without passing it around.
+# When instrumentation is off, NULL is active and every call is a no-op on a shared object.
+
+class TimerNode:
+    __slots__ = ('time', 'count', 'children')
+
+    def __init__(self):
+        self.time = 0.0
+        self.count = 0
+        self.children = {}
+
+    def to_dict(self):
+        data = {"time": round(self.time, 6), "count": self.count}
+        if self.children:
+            data["children"] = {name: child.to_dict() for name, child in self.children.items()}
+        return data
+
+
+class _Timer:
+    __slots__ = ('instrumentation', 'name', 'node', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.node = None
+        self.start = 0.0
+
+    def __enter__(self):
+        stack = self.instrumentation.stack
+        children = stack[-1].children
+        node = children.get(self.name)
+        if node is None:
+            node = children[self.name] = TimerNode()
+        stack.append(node)
+        self.node = node
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.node.time += time.perf_counter() - self.start
+        self.node.count += 1
+        self.instrumentation.stack.pop()
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self):
+        self.root = TimerNode()
+        self.stack = [self.root]  # Timers are only nested on the main thread
+        self.counters = {}
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def count(self, name, amount=1):
+        # Counters can be increased from worker threads
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, path, seconds):
+        # Adds a time measured elsewhere (e.g. in a worker thread) below the currently running timer.
+        # The path is a sequence of node names
+        with self._lock:
+            node = self.stack[-1]
+            for name in path:
+                child = node.children.get(name)
+                if child is None:
+                    child = node.children[name] = TimerNode()
+                node = child
+            node.time += seconds
+            node.count += 1
+
+    def report(self):
+        return {
+            "total_time": round(time.perf_counter() - self.start, 6),
+            "timings": {name: node.to_dict() for name, node in self.root.children.items()},
+            "counters": dict(self.counters),
+        }
+
+    def write_json(self, filepath, **extra):
+        report = dict(extra)
+        report.update(self.report())
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    def format_summary(self):
+        report = self.report()
+        lines = [f"Total: {report['total_time']:.3f}s"]
+
+        def add_lines(timings, depth):
+            for name, node in timings.items():
+                count = f" ({node['count']}x)" if node["count"] > 1 else ""
+                lines.append(f"{'  ' * depth}{name}: {node['time']:.3f}s{count}")
+                add_lines(node.get("children", {}), depth + 1)
+
+        add_lines(report["timings"], 1)
+        for name, value in report["counters"].items():
+            lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+class NullInstrumentation:
+    enabled = False
+    _timer = _NullTimer()
+
+    def timer(self, name):
+        return self._timer
+
+    def count(self, name, amount=1):
+        pass
+
+    def add_time(self, path, seconds):
+        pass
+
+    def report(self):
+        return {}
+
+
+NULL = NullInstrumentation()
+current = NULL
+
+
+@contextmanager
+def activate(instrumentation):
+    # Makes the given instrumentation the current one for the duration of the with-block
+    global current
+    previous = current
+    current = instrumentation
+    try:
+        yield instrumentation
+    finally:
+        current = previous
@@ -0,0 +1,71 @@
+import sys
+import logging
+from collections import deque
+
+# Logging for the whole addon, based on the standard logging module.
+# Messages use lazy %-formatting, so disabled levels cost only a level check:
+#   log = logger.get_logger("parser")
+#   log.debug("Item %d path: '%s'", i, path)
+
+LOGGER_NAME = "xps_scene_importer"
+DEFAULT_LEVEL = logging.INFO
+
+_logger = logging.getLogger(LOGGER_NAME)
+
+
+class Formatter(logging.Formatter):
+    # Keeps the "Info: ..." style of the console output
+    def format(self, record):
+        return f"{record.levelname.capitalize()}: {record.getMessage()}"
+
+
+class RingBufferHandler(logging.Handler):
+    # Keeps the last records in memory so they can be dumped after a failed import.
+    # Records are only formatted when they get dumped
+    def __init__(self, capacity=5000):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def clear(self):
+        self.records.clear()
+
+    def dump(self):
+        return "\n".join(f"{record.relativeCreated / 1000:9.3f}s {self.format(record)}" for record in list(self.records))
+
+
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setFormatter(Formatter())
+ring_buffer = RingBufferHandler()
+ring_buffer.setFormatter(Formatter())
+
+# Replace the handlers of a previous load of this module, e.g. after the addon got reloaded
+for handler in list(_logger.handlers):
+    _logger.removeHandler(handler)
+_logger.addHandler(console_handler)
+_logger.addHandler(ring_buffer)
+_logger.setLevel(DEFAULT_LEVEL)
+_logger.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    return _logger.getChild(name)
+
+
+def set_level(level):
+    _logger.setLevel(level)
+
+
+def get_level():
+    return _logger.level
+
+
+def dump_ring_buffer(filepath=None):
+    # Returns the buffered log, and writes it to the given file if there is one
+    text = ring_buffer.dump()
+    if filepath:
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return text
@@ -0,0 +1,64 @@
+import sys
+
+# Memory use of the running process, used by the low memory import mode.
+# Blender doesn't expose its memory use to Python, so it is read from the operating system.
+
+
+def get_memory_usage():
+    # Returns the current and the peak memory use of this process in bytes, values that are not available are None
+    try:
+        if sys.platform.startswith("linux"):
+            return _get_linux_memory_usage()
+        if sys.platform == "win32":
+            return _get_windows_memory_usage()
+        return _get_rusage_memory_usage()
+    except (OSError, ValueError, AttributeError):
+        return None, None
+
+
+def _get_linux_memory_usage():
+    values = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(value.split()[0]) * 1024
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def _get_windows_memory_usage():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None, None
+    return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+
+def _get_rusage_memory_usage():
+    # macOS only reports the peak, in bytes
+    import resource
+    return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def format_bytes(size):
+    if size is None:
+        return "unknown"
+    return f"{size / 1024 / 1024:.0f} MB"
@@ -0,0 +1,118 @@
+import os
+import bpy
+import hashlib
+import pathlib
+
+from . import instrumentation
+from . import logger
+from . import utils
+
+log = logger.get_logger("model_cache")
+
+# Characters that were imported with the XPS importer are saved as .blend files in here.
+# Later imports of the same model file append the objects from that .blend file instead of running the XPS importer again.
+# The cache key contains the size and modification time of the model file, so changed models are imported again.
+cache_dir = utils.resources_dir / "model_cache"
+
+# When the cache gets bigger than this, the least recently used models are deleted
+max_cache_size = 4 * 1024 ** 3
+
+
+def get_cache_file(mesh_file: pathlib.Path):
+    try:
+        stat = mesh_file.stat()
+    except OSError:
+        return None
+    key = f"{mesh_file.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    digest = hashlib.blake2b(key.encode(), digest_size=10).hexdigest()
+    return cache_dir / f"{mesh_file.stem}_{digest}.blend"
+
+
+def load(mesh_file: pathlib.Path, collection):
+    # Appends the cached objects of the model into the collection and returns them, or None if the model is not cached
+    cache_file = get_cache_file(mesh_file)
+    if not cache_file or not cache_file.exists():
+        instrumentation.current.count("model_cache_misses")
+        return None
+
+    try:
+        with bpy.data.libraries.load(str(cache_file), link=False) as (data_from, data_to):
+            data_to.objects = data_from.objects
+    except (OSError, RuntimeError) as e:
+        log.warning("Could not load cached model '%s', it will be imported again: %s", cache_file, e)
+        cache_file.unlink(missing_ok=True)
+        return None
+
+    objects = [obj for obj in data_to.objects if obj is not None]
+    if not objects:
+        return None
+    for obj in objects:
+        collection.objects.link(obj)
+
+    # Mark the file as recently used for the eviction
+    os.utime(cache_file)
+    instrumentation.current.count("model_cache_hits")
+    return objects
+
+
+def save(mesh_file: pathlib.Path, objects):
+    # Saves the freshly imported objects of the model, together with their meshes, materials and images.
+    # This has to happen before they get parented to anything that is not part of the model
+    cache_file = get_cache_file(mesh_file)
+    if not cache_file:
+        return
+
+    cache_dir.mkdir(exist_ok=True)
+    tmp_file = cache_file.with_name(cache_file.stem + ".tmp")
+    try:
+        bpy.data.libraries.write(str(tmp_file), set(objects), path_remap='ABSOLUTE')
+        os.replace(tmp_file, cache_file)
+    except (OSError, RuntimeError) as e:
+        log.warning("Could not save model '%s' to the model cache: %s", mesh_file, e)
+        return
+
+    evict()
+
+
+def get_cache_files():
+    if not cache_dir.exists():
+        return []
+    return list(cache_dir.glob("*.blend"))
+
+
+def evict(max_size=None):
+    # Deletes the least recently used models until the cache is small enough again
+    if max_size is None:
+        max_size = max_cache_size
+
+    files = []
+    for file in get_cache_files():
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, file))
+
+    total_size = sum(size for _, size, _ in files)
+    for _, size, file in sorted(files):
+        if total_size <= max_size:
+            break
+        try:
+            file.unlink()
+        except OSError:
+            continue
+        total_size -= size
+        log.info("Removed %s from the model cache", file.name)
+
+
+def clear():
+    # Deletes all cached models and returns the number of freed bytes
+    freed = 0
+    for file in get_cache_files():
+        try:
+            size = file.stat().st_size
+            file.unlink()
+        except OSError:
+            continue
+        freed += size
+    return freed
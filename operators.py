@@ -1,18 +1,24 @@
 import pathlib
+import logging
+import tempfile
 
 import bpy
 from bpy.types import Operator
 from bpy_extras.io_utils import ImportHelper
 
-from . import import_handler
+from . import logger
+from . import model_cache
 from . import utils, core
 
+log = logger.get_logger("operators")
+
 
 class ImportXPSButton(Operator, ImportHelper):
     bl_idname = "xps_importer.import_xps"
     bl_label = "Import XPS"
     bl_description = "Imports an XPS scene file"
-    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+    # No 'UNDO', the undo step is pushed in execute, in low memory mode only once global undo is back on
+    bl_options = {'REGISTER', 'INTERNAL'}
 
     filter_glob: bpy.props.StringProperty(default="*.scene", options={'HIDDEN'})
 
@@ -36,30 +42,312 @@ class ImportXPSButton(Operator, ImportHelper):
         description="Import ground from the XPS file",
         default=True,
     )
-    exclude_hidden_models: bpy.props.BoolProperty(
-        name="Exclude Hidden Models",
-        description="Excludes characters and objects that are hidden in the XPS file",
+    hidden_models: bpy.props.EnumProperty(
+        name="Hidden Models",
+        description="What to do with characters and objects that are hidden in the XPS file",
+        items=[
+            (core.HIDDEN_MODELS_EXCLUDE, "Exclude", "Don't import hidden models"),
+            (core.HIDDEN_MODELS_PLACEHOLDER, "Placeholder", "Add a hidden placeholder for each hidden model, which imports and poses the model once it gets unhidden"),
+            (core.HIDDEN_MODELS_IMPORT, "Import", "Import hidden models and hide them"),
+        ],
+        default=core.HIDDEN_MODELS_EXCLUDE,
+    )
+    update_existing: bpy.props.BoolProperty(
+        name="Update Existing Import",
+        description="If this file was already imported into the current scene, only apply what changed in the file since then."
+                    "\nChanged poses, positions, lights and the camera are updated, added and deleted models are imported or removed",
+        default=True,
+    )
+    use_model_cache: bpy.props.BoolProperty(
+        name="Use Model Cache",
+        description="Saves every imported model in a cache, so later imports of the same model don't have to run the XPS importer again."
+                    "\nThe cache is updated automatically when a model file changes",
         default=True,
     )
+    low_memory: bpy.props.BoolProperty(
+        name="Low Memory Mode",
+        description="Uses less memory for big scenes: Global undo is turned off during the import and only a single undo step is added afterwards,"
+                    "\nunused data that was created during the import is deleted, and the memory use is reported after the import",
+        default=False,
+    )
+    check_only: bpy.props.BoolProperty(
+        name="Only Check Models",
+        description="Only searches for all models used in the scene and reports the missing ones, without importing anything",
+        default=False,
+    )
+    write_report: bpy.props.BoolProperty(
+        name="Write Timing Report",
+        description="Measures the time of every import step and saves it as a JSON file next to the .scene file",
+        default=False,
+    )
+    debug_log: bpy.props.BoolProperty(
+        name="Debug Log",
+        description="Prints every value read from the XPS file and every searched model folder to the console."
+                    "\nThis slows down the import of large scenes",
+        default=False,
+    )
 
     def execute(self, context):
         filepath = self.filepath
-        print("\nInfo: Importing XPS file: " + filepath)
         if not filepath.lower().endswith(".scene"):
             self.report({"ERROR"}, "Please select a .scene file!")
             return {'CANCELLED'}
 
+        # Only keep the log of this import, so it can be saved if the import fails
+        logger.ring_buffer.clear()
+        log_level = logger.get_level()
+        if self.debug_log:
+            logger.set_level(logging.DEBUG)
+        log.info("Importing XPS file: %s", filepath)
+
+        # Without global undo, Blender doesn't keep a second copy of everything that got imported
+        undo_enabled = self.low_memory and not self.check_only and utils.suspend_global_undo()
+
+        # The importer loads numpy, so it's only imported once it is needed
+        from . import import_handler
+        try:
+            importer = import_handler.ImportXPS(filepath, self.import_models, self.import_lights, self.import_camera, self.import_ground, self.hidden_models,
+                                                check_only=self.check_only, profile=self.write_report, update_existing=self.update_existing,
+                                                use_model_cache=self.use_model_cache, low_memory=self.low_memory)
+        except ValueError as e:
+            log.error(str(e))
+            self.report({"ERROR"}, f"{e}\nSaved import log to {self.save_log()}")
+            return {'CANCELLED'}
+        finally:
+            logger.set_level(log_level)
+            if undo_enabled:
+                utils.resume_global_undo()
+
+        if importer.error_handler.has_errors():
+            error_msg = importer.error_handler.get_error_message()
+            self.report({"ERROR"}, f"{error_msg}\nSaved import log to {self.save_log()}")
+            return {'CANCELLED'}
+
+        if self.check_only:
+            self.report({'INFO'}, f"All {importer.model_count} models of XPS file {filepath} were found")
+            return {'FINISHED'}
+
+        # A single undo step for the whole import, also in low memory mode
+        bpy.ops.ed.undo_push(message="Import XPS")
+
+        if self.low_memory:
+            self.report({'INFO'}, f"Imported XPS file {filepath}. {importer.get_memory_summary()}")
+            return {'FINISHED'}
+
+        if self.write_report:
+            report = importer.instrumentation.report()
+            self.report({'INFO'}, f"Imported XPS file {filepath} in {report['total_time']:.2f}s, saved timings to {importer.report_file}")
+            return {'FINISHED'}
+
+        if importer.updated:
+            counts = importer.update_counts
+            self.report({'INFO'}, f"Updated XPS file {filepath}: {counts['added']} added, {counts['updated']} updated, {counts['removed']} removed models")
+            return {'FINISHED'}
+
+        self.report({'INFO'}, f"Imported XPS file {filepath}")
+        return {'FINISHED'}
+
+    @staticmethod
+    def save_log():
+        log_file = utils.resources_dir / "last_import.log"
+        logger.dump_ring_buffer(log_file)
+        return log_file
+
+
+class ImportXPSSequenceButton(Operator, ImportHelper):
+    bl_idname = "xps_importer.import_xps_sequence"
+    bl_label = "Import XPS Sequence"
+    bl_description = "Imports a numbered sequence of XPS scene files (pose_0001.scene, pose_0002.scene, ...) as animation." \
+                     "\nThe characters are imported from the first file, the poses of all files become keyframes"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    filter_glob: bpy.props.StringProperty(default="*.scene", options={'HIDDEN'})
+
+    frame_start: bpy.props.IntProperty(
+        name="Start Frame",
+        description="Frame of the first scene file",
+        default=1,
+    )
+    frame_step: bpy.props.IntProperty(
+        name="Frame Step",
+        description="Number of frames between two scene files",
+        default=1,
+        min=1,
+    )
+    import_lights: bpy.props.BoolProperty(
+        name="Import Lights",
+        description="Import lights from the first XPS file",
+        default=True,
+    )
+    import_camera: bpy.props.BoolProperty(
+        name="Import Camera",
+        description="Import camera from the first XPS file",
+        default=True,
+    )
+    import_ground: bpy.props.BoolProperty(
+        name="Import Ground",
+        description="Import ground from the first XPS file",
+        default=True,
+    )
+    use_model_cache: bpy.props.BoolProperty(
+        name="Use Model Cache",
+        description="Saves every imported model in a cache, so later imports of the same model don't have to run the XPS importer again",
+        default=True,
+    )
+
+    def execute(self, context):
+        from . import import_handler
+
+        if not self.filepath.lower().endswith(".scene"):
+            self.report({"ERROR"}, "Please select a .scene file!")
+            return {'CANCELLED'}
+
+        filepaths = import_handler.find_scene_sequence(self.filepath)
         try:
-            importer = import_handler.ImportXPS(filepath, self.import_models, self.import_lights, self.import_camera, self.import_ground, self.exclude_hidden_models)
+            importer = import_handler.ImportXPSSequence(filepaths, self.frame_start, self.frame_step, self.import_lights, self.import_camera,
+                                                        self.import_ground, self.use_model_cache)
         except ValueError as e:
+            log.error(str(e))
             self.report({"ERROR"}, str(e))
             return {'CANCELLED'}
 
-        if importer.scene.error_handler.has_errors():
-            self.report({"ERROR"}, importer.scene.error_handler.get_error_message())
+        if importer.error_handler.has_errors():
+            self.report({"ERROR"}, importer.error_handler.get_error_message())
             return {'CANCELLED'}
 
-        self.report({'INFO'}, f"Imported XPS file {filepath}")
+        self.report({'INFO'}, f"Imported {len(filepaths)} XPS files as animation of {len(importer.animations)} characters")
+        return {'FINISHED'}
+
+
+class ImportPoseButton(Operator, ImportHelper):
+    bl_idname = "xps_importer.import_pose"
+    bl_label = "Import XPS Pose"
+    bl_description = "Applies an XPS .pose file to the selected armature." \
+                     "\nCan also import a whole folder of pose files as keyframes or as pose library entries"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    filter_glob: bpy.props.StringProperty(default="*.pose", options={'HIDDEN'})
+
+    mode: bpy.props.EnumProperty(
+        name="Mode",
+        description="How the pose files are applied to the armature",
+        items=[
+            (core.POSE_MODE_APPLY, "Apply Pose", "Pose the armature with the selected pose file"),
+            (core.POSE_MODE_KEYFRAMES, "Folder as Keyframes", "Add every pose file in the folder as a keyframe, sorted by name"),
+            (core.POSE_MODE_LIBRARY, "Folder as Pose Library", "Add every pose file in the folder as a pose to the pose library"),
+        ],
+        default=core.POSE_MODE_APPLY,
+    )
+    frame_start: bpy.props.IntProperty(
+        name="Start Frame",
+        description="Frame of the first pose file",
+        default=1,
+    )
+    frame_step: bpy.props.IntProperty(
+        name="Frame Step",
+        description="Number of frames between two pose files",
+        default=1,
+        min=1,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return context.object is not None and context.object.type == "ARMATURE"
+
+    def execute(self, context):
+        from . import import_handler
+
+        filepath = pathlib.Path(self.filepath)
+        if self.mode == core.POSE_MODE_APPLY:
+            if filepath.suffix.lower() != ".pose":
+                self.report({"ERROR"}, "Please select a .pose file!")
+                return {'CANCELLED'}
+            filepaths = [filepath]
+        else:
+            filepaths = import_handler.find_pose_files(filepath if filepath.is_dir() else filepath.parent)
+
+        try:
+            importer = import_handler.ImportXPSPose(context.object, filepaths, self.mode, self.frame_start, self.frame_step)
+        except ValueError as e:
+            log.error(str(e))
+            self.report({"ERROR"}, str(e))
+            return {'CANCELLED'}
+
+        if self.mode == core.POSE_MODE_APPLY:
+            self.report({'INFO'}, f"Applied pose {filepath.name}")
+        elif self.mode == core.POSE_MODE_KEYFRAMES:
+            self.report({'INFO'}, f"Added {len(filepaths)} poses as keyframes")
+        else:
+            self.report({'INFO'}, f"Added {len(importer.actions)} poses to the pose library")
+        return {'FINISHED'}
+
+
+class LoadPlaceholdersButton(Operator):
+    bl_idname = "xps_importer.load_placeholders"
+    bl_label = "Load Hidden Models"
+    bl_description = "Imports the models of the selected placeholders, or of all placeholders in this scene if none are selected." \
+                     "\nPlaceholders also load their model automatically when they get unhidden"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        return bool(core.PlaceholderHandler.placeholders)
+
+    def execute(self, context):
+        placeholders = [obj for obj in context.selected_objects if core.is_placeholder(obj)]
+        if not placeholders:
+            placeholders = [obj for obj in context.scene.objects if core.is_placeholder(obj)]
+        if not placeholders:
+            self.report({"ERROR"}, "There are no placeholders in this scene!")
+            return {'CANCELLED'}
+
+        errors = []
+        for placeholder in placeholders:
+            core.PlaceholderHandler.discard(placeholder)
+            errors += core.load_placeholder(placeholder).errors
+
+        if errors:
+            self.report({"ERROR"}, "Errors while loading hidden models:\n- " + "\n- ".join(errors))
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f"Loaded {len(placeholders)} hidden models")
+        return {'FINISHED'}
+
+
+class LiveSyncButton(Operator):
+    bl_idname = "xps_importer.live_sync"
+    bl_label = "Live Sync"
+    bl_description = "Watches the scene files of all XPS imports in this scene and updates the imports every time the files are saved in XPS." \
+                     "\nClick again to stop watching"
+    bl_options = {'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        return core.SceneWatcher.is_watching() or bool(core.get_scene_collections())
+
+    def execute(self, context):
+        if core.SceneWatcher.is_watching():
+            core.SceneWatcher.stop()
+            self.report({'INFO'}, "Stopped live sync")
+            return {'FINISHED'}
+
+        collections = core.get_scene_collections()
+        for collection in collections:
+            core.SceneWatcher.start(collection[core.SCENE_FILE_PROPERTY])
+        self.report({'INFO'}, f"Started live sync of {len(collections)} XPS scenes")
+        return {'FINISHED'}
+
+
+class ClearModelCacheButton(Operator):
+    bl_idname = "xps_importer.clear_model_cache"
+    bl_label = "Clear Model Cache"
+    bl_description = "Deletes all cached models, so they get imported with the XPS importer again." \
+                     "\nUse this after changing the XPS importer or the textures of a model"
+    bl_options = {'INTERNAL'}
+
+    def execute(self, context):
+        freed = model_cache.clear()
+        self.report({'INFO'}, f"Cleared the model cache, freed {freed / 1024 / 1024:.1f} MB")
         return {'FINISHED'}
 
 
@@ -95,113 +383,59 @@ class SelectAssetDirButton(Operator, ImportHelper):
         return {'FINISHED'}
 
 
-class ImportXPSTestButton(Operator):
-    bl_idname = "xps_importer.import_xps_test"
-    bl_label = "Dev Test Button"
-    bl_description = "Does lots of dev magic"
-    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
-
-    def execute(self, context):
-        test_path = pathlib.Path("E:\\Work\\judgearts - XPS Importer\\lara_scene.scene")
-        if not test_path.exists():
-            self.report({"ERROR"}, "Ey, you are not the dev! Don't touch this button!")
-            return {'CANCELLED'}
+class RebuildAssetIndexButton(Operator):
+    bl_idname = "xps_importer.rebuild_asset_index"
+    bl_label = "Rebuild Asset Index"
+    bl_description = "Rescans the whole asset directory." \
+                     "\nThe index is used to quickly find models that are not at their original path and is otherwise updated automatically"
+    bl_options = {'INTERNAL'}
 
-        # Custom test scene
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\lara_scene.scene", import_models=True)
-        self.report({'INFO'}, f"Small test successful!")
-        # return {'FINISHED'}
+    @classmethod
+    def poll(cls, context):
+        return bool(context.scene.xps_importer_asset_dir)
 
-
-
-
-
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\lara_scene.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.4 or io_handler.window_height != 700:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\3lamptest_NOSCOTT.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.9 or io_handler.window_height != 1358:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        # Test all documented scene files
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lights1only.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1331:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lights2only.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1331:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lights3only.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1331:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lights4only.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1331:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lights5only.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1331:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        # Test all documented scene files with characters
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lighttest1.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1297:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
-
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lighttest2.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1297:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
+    def execute(self, context):
+        asset_dir = pathlib.Path(context.scene.xps_importer_asset_dir)
+        if not asset_dir.exists():
+            self.report({"ERROR"}, f"The asset directory '{asset_dir}' does not exist!")
             return {'CANCELLED'}
-        io_handler.scene.remove()
 
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lighttest3.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1297:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
+        index = utils.get_asset_index(asset_dir, refresh=False)
+        index.rebuild()
+        self.report({'INFO'}, f"Indexed {len(index.dirs)} folders in the asset directory")
+        return {'FINISHED'}
 
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lighttest4.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1297:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
 
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Test Files\\lighttest5.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.85 or io_handler.window_height != 1297:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
+class ImportXPSTestButton(Operator):
+    bl_idname = "xps_importer.import_xps_test"
+    bl_label = "Dev Test Button"
+    bl_description = "Imports generated test scenes of all supported file versions and checks that they are read correctly"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\Lighting-Setting-XPS-2.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 1.0 or io_handler.window_height != 972:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
+    test_scenes = {
+        "version_1_21": dict(version=(1, 21), item_count=3, bone_count=50),
+        "version_1_22": dict(version=(1, 22), item_count=3, bone_count=50),
+        "version_1_30": dict(version=(1, 30), item_count=3, bone_count=50),
+        "hidden_items": dict(item_count=5, bone_count=20, hidden_item_ratio=0.5),
+        "long_strings": dict(item_count=2, bone_count=20, accessory_count=3, string_length=200),
+        "no_items": dict(item_count=0),
+    }
 
-        io_handler = import_handler.ImportXPS("E:\\Work\\judgearts - XPS Importer\\background_test.scene", import_models=False)
-        if round(io_handler.light_shadow_depth, 2) != 0.4 or io_handler.window_height != 700:
-            self.report({'ERROR'}, f"Error importing XPS file {io_handler.filepath}")
-            return {'CANCELLED'}
-        io_handler.scene.remove()
+    def execute(self, context):
+        from . import import_handler
+        from . import scene_generator
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, settings in self.test_scenes.items():
+                filepath = pathlib.Path(directory) / f"{name}.scene"
+                expected = scene_generator.write_scene(filepath, **settings)
+
+                io_handler = import_handler.ImportXPS(str(filepath), import_models=False, import_ground=False)
+                errors = scene_generator.compare_documents(expected, io_handler.document)
+                io_handler.scene.remove()
+                if errors:
+                    self.report({'ERROR'}, f"Error importing test scene '{name}':\n" + "\n".join(errors[:10]))
+                    return {'CANCELLED'}
 
         self.report({'INFO'}, f"All tests ran successfully!")
         return {'FINISHED'}
@@ -1,5 +1,6 @@
 
 import bpy
+from . import core
 from . import operators as ops
 
 
@@ -35,12 +36,27 @@ class MainPanel(Panel, bpy.types.Panel):
         row = layout.row(align=True)
         row.prop(context.scene, "xps_importer_asset_dir", text="")
         row.operator(ops.SelectAssetDirButton.bl_idname, text="", icon="FILE_FOLDER")
+        row.operator(ops.RebuildAssetIndexButton.bl_idname, text="", icon="FILE_REFRESH")
 
         layout.separator()
 
         row = layout.row(align=True)
         row.scale_y = 1.6
         row.operator(ops.ImportXPSButton.bl_idname, icon="IMPORT")
+        row.operator(ops.ClearModelCacheButton.bl_idname, text="", icon="TRASH")
+
+        row = layout.row(align=True)
+        row.operator(ops.ImportXPSSequenceButton.bl_idname, icon="SEQUENCE")
+
+        row = layout.row(align=True)
+        row.operator(ops.ImportPoseButton.bl_idname, icon="ARMATURE_DATA")
+
+        row = layout.row(align=True)
+        row.operator(ops.LoadPlaceholdersButton.bl_idname, icon="HIDE_OFF")
+
+        row = layout.row(align=True)
+        watching = core.SceneWatcher.is_watching()
+        row.operator(ops.LiveSyncButton.bl_idname, text="Stop Live Sync" if watching else "Live Sync", icon="PAUSE" if watching else "PLAY", depress=watching)
 
         # layout.separator()
         #
@@ -0,0 +1,315 @@
+import logging
+
+from . import bin_ops
+from . import logger
+from . import instrumentation
+from .document import SceneDocument, SceneItem, SceneCamera, SceneLight, PostProcessing, Background, SkyDome, WindowSize
+
+log = logger.get_logger("parser")
+
+
+class SceneParser:
+    latest_supported_version = (1, 21)
+    latest_supported_version_str = '.'.join(str(x) for x in latest_supported_version)
+
+    def __init__(self, filepath, read_bones=True):
+        self.filepath = filepath
+        # Without read_bones only the bone counts are read and the items have no bones, which also avoids importing numpy
+        self.read_bones = read_bones
+
+        self.reader: bin_ops.BinaryReader = None
+        self.document: SceneDocument = None
+
+    @property
+    def version(self):
+        return self.document.version
+
+    def parse(self) -> SceneDocument:
+        log.info("Reading file: %s", self.filepath)
+
+        log.info("Opening file reader..")
+        with bin_ops.BinaryReader.from_file(self.filepath) as self.reader:
+            self._read_content()
+        return self.document
+
+    def _read_content(self):
+        timer = instrumentation.current.timer
+
+        log.info("Reading file header..")
+        with timer("header"):
+            self._read_header()
+
+        log.info("Reading items..")
+        with timer("items"):
+            self._read_items()
+
+        log.info("Reading camera..")
+        with timer("camera"):
+            self._read_camera()
+
+        log.info("Reading lights..")
+        with timer("lights"):
+            self._read_lights()
+
+        log.info("Reading post processing..")
+        with timer("post processing"):
+            self._read_post_processing()
+
+        log.info("Reading background..")
+        with timer("background"):
+            self._read_background()
+
+        log.info("Reading sky dome..")
+        with timer("sky dome"):
+            self._read_sky_dome()
+
+        log.info("Reading window size..")
+        with timer("window size"):
+            self._read_window_size()
+
+    def _read_header(self):
+        # Read version
+        version_major = self.reader.readUInt16()
+        version_minor = self.reader.readUInt16()
+        self.document = SceneDocument(self.filepath, (version_major, version_minor))
+        log.info("Version: %s", self.version)
+
+        if self.version < self.latest_supported_version:
+            raise ValueError(f"Unsupported file version {self.version}. Only file version {self.latest_supported_version_str} and above are supported.")
+
+    def _read_items(self):
+        # Read item count
+        item_count = self.reader.readUInt32()
+        log.debug("Item count: %s", item_count)
+
+        # Checked once, so the item loop costs nothing extra when debug logging is off
+        debug = log.isEnabledFor(logging.DEBUG)
+
+        # Read items
+        for i in range(item_count):
+            # Read the item info
+            item_name = self.reader.readString()
+            item_path = self.reader.readString()
+
+            # Read the item visibility
+            item_visibility = self.reader.readByte()
+
+            # Read the item scale
+            if self.version >= (1, 8):
+                item_scale = self.reader.readSingles(3)
+            else:
+                scale = self.reader.readSingle()
+                item_scale = (scale, scale, scale)
+
+            item = SceneItem(i, item_name, item_path, item_visibility, item_scale)
+            self.document.items.append(item)
+
+            # Read the bone data
+            bone_count = self.reader.readUInt32()
+            item.bone_count = bone_count
+            if self.read_bones:
+                item.bones = self.reader.readBones(bone_count, round_to=4)
+            else:
+                self.reader.skipBones(bone_count)
+            instrumentation.current.count("bones_read", bone_count)
+
+            # Read character location
+            item.location = self.reader.readSingles(3)
+
+            # Read all the accessorises
+            accessory_count = self.reader.readUInt32()
+            for _ in range(accessory_count):
+                name = self.reader.readString()
+                self.reader.skip(1)  # Skip one byte
+                item.accessories.append(name)
+
+            # Read all secondary accessories
+            accessory_count = self.reader.readUInt16()
+            for _ in range(accessory_count):
+                name = self.reader.readString()
+                self.reader.skip(1)  # Skip one byte
+                item.secondary_accessories.append(name)
+
+            # Read the glow information
+            if self.version >= (1, 11):
+                item.glow_colors = self.reader.readSingles(6, round_to=2)
+
+            if debug:
+                self._log_item(item)
+
+    @staticmethod
+    def _log_item(item: SceneItem):
+        i = item.index
+        log.debug("Item %s type: '%s'", i, item.name)
+        log.debug("Item %s path: '%s'", i, item.path)
+        log.debug("Item %s visibility: %s", i, item.visibility)
+        log.debug("Item %s scale: %s", i, item.scale)
+        log.debug("Item %s bone count: %s", i, item.bone_count)
+        log.debug("Item %s location: %s", i, item.location)
+        for name in item.accessories:
+            log.debug("Item %s accessory name: '%s'", i, name)
+        for name in item.secondary_accessories:
+            log.debug("Item %s secondary accessory name: '%s'", i, name)
+        for j, color in enumerate(item.glow_colors):
+            log.debug("Item %s glow color %s: %s", i, j, color)
+
+    def _read_camera(self):
+        camera_fov = self.reader.readSingle()
+        log.debug("Camera fov: %s", camera_fov)
+
+        camera_target = self.reader.readSingles(3)
+        log.debug("Camera target: %s", camera_target)
+
+        camera_distance = self.reader.readSingle()
+        log.debug("Camera distance: %s", camera_distance)
+
+        camera_rotation_horizontal = self.reader.readSingle()
+        camera_rotation_vertical = self.reader.readSingle()
+        log.debug("Camera rotation: %s, %s", camera_rotation_horizontal, camera_rotation_vertical)
+
+        self.document.camera = SceneCamera(camera_fov, camera_target, camera_distance, camera_rotation_horizontal, camera_rotation_vertical)
+
+    def _read_lights(self):
+        self.reader.skip(4)  # Skip one single
+        for i in range(1, 4):
+            # Skip one byte if it's not the first light
+            if self.version >= (1, 30):
+                if i != 1:
+                    self.reader.skip(1)
+
+            light_direction = self.reader.readSingles(3, round_to=6)
+            log.debug("Light %s direction: %s", i, light_direction)
+
+            light_intensity = 1
+            if self.version >= (1, 2):
+                light_intensity = self.reader.readSingle(round_to=2)
+            log.debug("Light %s intensity: %s", i, light_intensity)
+
+            light_color = (self.reader.readByte(),
+                           self.reader.readByte(),
+                           self.reader.readByte())
+            log.debug("Light %s color: %s", i, light_color)
+
+            light_shadow_depth = self.reader.readSingle(round_to=2)
+            log.debug("Light %s shadow depth: %s", i, light_shadow_depth)
+
+            self.document.lights.append(SceneLight(i, light_direction, light_intensity, light_color, light_shadow_depth))
+
+    def _read_post_processing(self):
+        if self.version < (1, 9):
+            return
+
+        use_post_processing = None
+        if self.version > (1, 21):
+            use_post_processing = self.reader.readByte()
+            log.debug("Use post processing?: %s", use_post_processing)
+
+        brightness = self.reader.readSingle()
+        log.debug("Brightness: %s", brightness)
+
+        gamma = self.reader.readSingle()
+        log.debug("Gamma: %s", gamma)
+
+        contrast = self.reader.readSingle()
+        log.debug("Contrast: %s", contrast)
+
+        saturation = self.reader.readSingle()
+        log.debug("Saturation: %s", saturation)
+
+        self.reader.skip(1)  # Skip 1 bytes
+
+        if self.version > (1, 21):
+            self.reader.skip(4)  # Skip 4 bytes
+
+        self.document.post_processing = PostProcessing(use_post_processing, brightness, gamma, contrast, saturation)
+
+    def _read_background(self):
+        ground_visibility = self.reader.readByte()
+        ground_texture_path = self.reader.readString()
+        log.debug("Display ground?: %s", ground_visibility)
+        log.debug("Ground texture path: %s", ground_texture_path)
+
+        background = Background(ground_visibility, ground_texture_path)
+        self.document.background = background
+
+        if self.version >= (1, 1):
+            background.color = (self.reader.readByte(),
+                                self.reader.readByte(),
+                                self.reader.readByte())
+            log.debug("Background color: %s", background.color)
+
+        background.texture_path = self.reader.readString()
+        log.debug("Background texture path: %s", background.texture_path)
+
+        if self.version > (1, 21):
+            background.texture_type = self.reader.readString()  # Image scale setting: (Fit, Stretch, Crop, Center)
+            log.debug("Background texture type: %s", background.texture_type)
+
+            background.hud_texture_path = self.reader.readString()
+            log.debug("HUD texture path: %s", background.hud_texture_path)
+
+    def _read_sky_dome(self):
+        if self.version >= (1, 6):
+            display_sky_dome = self.reader.readByte()
+            log.debug("Display sky dome?: %s", display_sky_dome)
+
+            sky_dome_type = self.reader.readString()
+            log.debug("Sky dome type: %s", sky_dome_type)
+
+            sky_dome_rotation = self.reader.readSingle()
+            log.debug("Sky dome rotation: %s", sky_dome_rotation)
+
+            sky_dome_elevation = self.reader.readSingle()
+            log.debug("Sky dome elevation: %s", sky_dome_elevation)
+
+            self.document.sky_dome = SkyDome(display_sky_dome, sky_dome_type, sky_dome_rotation, sky_dome_elevation)
+
+    def _read_window_size(self):
+        if self.version >= (1, 7):
+            is_maximized = self.reader.readByte()
+            window_width = self.reader.readUInt32()
+            window_height = self.reader.readUInt32()
+            log.debug("Is maximized?: %s", is_maximized)
+            log.debug("Window size: %sx%s", window_width, window_height)
+
+            self.document.window_size = WindowSize(is_maximized, window_width, window_height)
+
+
+def parse_scene(filepath, read_bones=True) -> SceneDocument:
+    return SceneParser(filepath, read_bones=read_bones).parse()
+
+
+def iter_pose_file(filepath):
+    # Reads an XPS .pose file line by line and yields (bone name, values) for every bone.
+    # Each line looks like "bone name: rx ry rz tx ty tz sx sy sz", with the rotation in degrees. Older pose files have no scale
+    with open(filepath, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            name, separator, values = line.rpartition(":")
+            try:
+                values = [float(value) for value in values.split()]
+            except ValueError:
+                values = None
+            if not separator or not name or values is None or len(values) not in (6, 9):
+                raise ValueError(f"Invalid line {line_number} in pose file '{filepath}': {line}")
+            if len(values) == 6:
+                values += [1, 1, 1]
+            yield name.strip(), values
+
+
+def parse_pose(filepath):
+    # Returns the bones of an XPS .pose file as bone records, like the bones of the items in a scene file
+    import numpy as np
+
+    names = []
+    values = []
+    for name, bone_values in iter_pose_file(filepath):
+        names.append(name)
+        values.extend(bone_values)
+    log.debug("Read %s bones from pose file %s", len(names), filepath)
+
+    values = np.array(values, dtype=np.float64).reshape(len(names), 9)
+    return bin_ops.make_bones(names, values)
@@ -0,0 +1,142 @@
+import numpy as np
+
+from . import conversion
+from .bin_ops import make_bones
+
+# Vectorized versions of utils.xps_bone_rotate, xps_bone_translate and xps_bone_scale.
+# Quaternions are (N, 4) arrays in Blender's (w, x, y, z) order.
+
+def quaternion_multiply(a, b):
+    aw, ax, ay, az = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bw, bx, by, bz = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    return np.stack((
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ), axis=1)
+
+
+def quaternion_conjugate(q):
+    return q * np.array((1, -1, -1, -1), dtype=q.dtype)
+
+
+def quaternion_rotate(q, vectors):
+    # Rotates each vector by its quaternion, same as "quaternion @ vector" in mathutils
+    w = q[:, 0:1]
+    u = q[:, 1:4]
+    t = 2 * np.cross(u, vectors)
+    return vectors + w * t + np.cross(u, t)
+
+
+def xps_rotations_to_quaternions(rotations):
+    # Turn the XPS rotations (degrees) into Blender space ('YXZ' euler), then into quaternions
+    half_angles = conversion.rotation_to_blender(rotations) / 2
+    x, y, z = half_angles[:, 0], half_angles[:, 1], half_angles[:, 2]
+
+    zeros = np.zeros_like(x)
+    qx = np.stack((np.cos(x), np.sin(x), zeros, zeros), axis=1)
+    qy = np.stack((np.cos(y), zeros, np.sin(y), zeros), axis=1)
+    qz = np.stack((np.cos(z), zeros, zeros, np.sin(z)), axis=1)
+
+    # Euler order 'YXZ' rotates around Y first, then X, then Z
+    return quaternion_multiply(qz, quaternion_multiply(qx, qy))
+
+
+def pack_bones(bones):
+    # Flattens the bone records into a names string and a list of floats, so they can be stored as custom properties
+    values = np.concatenate((bones['rot'], bones['loc'], bones['scale']), axis=1)
+    return "\n".join(bones['name']), values.ravel().tolist()
+
+
+def unpack_bones(names, values):
+    names = names.split("\n") if names else []
+    values = np.asarray(values, dtype=np.float64).reshape(len(names), 9)
+    return make_bones(names, values)
+
+
+def use_quaternion_rotation(armature):
+    # Poses are written to rotation_quaternion, which is ignored by bones in an euler or axis angle mode.
+    # Blender converts the current rotation when the mode changes, so the bones keep their pose
+    for pose_bone in armature.pose.bones:
+        if pose_bone.rotation_mode != 'QUATERNION':
+            pose_bone.rotation_mode = 'QUATERNION'
+
+
+class PoseApplier:
+    # Poses all bones of an armature at once. The bone lookup and the rest orientations are only built once per armature
+
+    def __init__(self, armature):
+        self.armature = armature
+        use_quaternion_rotation(armature)
+
+        pose_bones = armature.pose.bones
+        self.bone_count = len(pose_bones)
+        self.bone_indices = {bone.name: i for i, bone in enumerate(pose_bones)}
+
+        rest_rotations = [tuple(bone.bone.matrix_local.to_quaternion()) for bone in pose_bones]  # LOCAL EditBone
+        self.rest_rotations = np.array(rest_rotations, dtype=np.float64).reshape(self.bone_count, 4)
+        self.rest_rotations_inverted = quaternion_conjugate(self.rest_rotations)
+
+    def _get(self, prop, size):
+        values = np.empty(self.bone_count * size, dtype=np.float32)
+        self.armature.pose.bones.foreach_get(prop, values)
+        return values.reshape(self.bone_count, size)
+
+    def _set(self, prop, values):
+        self.armature.pose.bones.foreach_set(prop, values.astype(np.float32).ravel())
+
+    def reset(self):
+        # Puts all bones back into their rest pose
+        self._set('rotation_quaternion', np.tile(np.array((1, 0, 0, 0), dtype=np.float32), (self.bone_count, 1)))
+        self._set('location', np.zeros((self.bone_count, 3), dtype=np.float32))
+        self._set('scale', np.ones((self.bone_count, 3), dtype=np.float32))
+        self.armature.update_tag()
+
+    def get_pose(self, bones, from_rest=False):
+        # Computes the full rotation, location and scale arrays of the armature with the given bone records applied.
+        # Bones without a record, or with an identity record, keep their current values, or their rest values if from_rest is set
+        indices = np.fromiter((self.bone_indices.get(name, -1) for name in bones['name'].tolist()), dtype=np.intp, count=len(bones))
+        found = indices >= 0
+        indices = indices[found]
+        rotations_xps = bones['rot'][found]
+        locations_xps = bones['loc'][found]
+        scales_xps = bones['scale'][found]
+
+        if from_rest:
+            rotations = np.tile(np.array((1, 0, 0, 0), dtype=np.float64), (self.bone_count, 1))
+            locations = np.zeros((self.bone_count, 3), dtype=np.float64)
+            scales = np.ones((self.bone_count, 3), dtype=np.float64)
+        else:
+            rotations = self._get('rotation_quaternion', 4).astype(np.float64)
+            locations = self._get('location', 3).astype(np.float64)
+            scales = self._get('scale', 3).astype(np.float64)
+
+        mask = rotations_xps.any(axis=1)
+        if mask.any():
+            i = indices[mask]
+            rotation = xps_rotations_to_quaternions(rotations_xps[mask])
+            rotations[i] = quaternion_multiply(quaternion_multiply(self.rest_rotations_inverted[i], rotation), self.rest_rotations[i])
+
+        mask = locations_xps.any(axis=1)
+        if mask.any():
+            i = indices[mask]
+            locations[i] = quaternion_rotate(self.rest_rotations_inverted[i], conversion.location_to_blender(locations_xps[mask]))
+
+        # TODO: This is absolutely not like the XPS behavior, but it's somewhat close
+        mask = (scales_xps != 1).any(axis=1)
+        if mask.any():
+            scales[indices[mask]] = scales_xps[mask]
+
+        return rotations, locations, scales, int(found.sum()), int((~found).sum())
+
+    def apply(self, bones, from_rest=False):
+        # Returns the number of posed and missing bones
+        rotations, locations, scales, posed_count, missing_count = self.get_pose(bones, from_rest)
+        # From rest, bones without a record go back to their rest pose, even if no bone matched at all
+        if from_rest or posed_count:
+            self._set('rotation_quaternion', rotations)
+            self._set('location', locations)
+            self._set('scale', scales)
+            self.armature.update_tag()
+        return posed_count, missing_count
@@ -0,0 +1,32 @@
+import os
+import sys
+import glob
+import pathlib
+
+# Helpers shared by the command line tools (batch converter, inspector, catalog).
+# Only uses the standard library, so it can be imported without Blender and numpy.
+
+
+def collect_scene_files(inputs):
+    files = []
+    for pattern in inputs:
+        path = pathlib.Path(pattern)
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.scene")))
+        elif path.is_file():
+            files.append(path)
+        else:
+            files.extend(sorted(pathlib.Path(p) for p in glob.glob(pattern, recursive=True) if p.lower().endswith(".scene")))
+
+    # Remove duplicates, but keep the order
+    return list(dict.fromkeys(f.resolve() for f in files))
+
+
+def run_cli(func, *args):
+    # Runs a command and returns its exit code, or 1 if the output was closed early, e.g. by "| head"
+    try:
+        return func(*args)
+    except BrokenPipeError:
+        # Point stdout to devnull, so Python doesn't fail again when flushing it at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
@@ -0,0 +1,217 @@
+import random
+import numpy as np
+
+from . import bin_ops
+from .document import SceneDocument, SceneItem, SceneCamera, SceneLight, PostProcessing, Background, SkyDome, WindowSize
+
+# Generates synthetic .scene files for tests and benchmarks, without Blender and without any real XPS scenes.
+# First a random SceneDocument is created, then it gets written with the bin_ops write functions.
+# The values are rounded the same way the parser rounds them, so a parsed file can be compared to its document.
+
+
+def create_document(version=(1, 21), item_count=10, bone_count=100, accessory_count=2, secondary_accessory_count=1, string_length=16,
+                    hidden_item_ratio=0.0, seed=0, filepath=None) -> SceneDocument:
+    if version < (1, 21):
+        raise ValueError(f"Only file versions 1.21 and above can be generated, got {version}.")
+    if not 1 <= string_length <= 255:
+        raise ValueError(f"The string length has to be between 1 and 255, got {string_length}.")
+
+    rng = random.Random(seed)
+
+    def single(low=-1.0, high=1.0):
+        # Round trip through a single, so the document contains exactly what the parser will read
+        return float(np.float32(rng.uniform(low, high)))
+
+    def rounded(round_to, low=-1.0, high=1.0):
+        return round(single(low, high), round_to)
+
+    document = SceneDocument(filepath, version)
+
+    # All items share the same rig, just like most real scenes do
+    bone_names = [make_string(f"bone{j}", string_length) for j in range(bone_count)]
+
+    for i in range(item_count):
+        visibility = 0 if rng.random() < hidden_item_ratio else 1
+        path = make_string(f"data\\model{i}", string_length)
+        item = SceneItem(i, make_string("generic_item", string_length), path, visibility, (single(0.5, 2),) * 3)
+
+        values = np.array([rng.uniform(-180, 180) for _ in range(bone_count * 9)], dtype=np.float32)
+        values = values.astype(np.float64).reshape(bone_count, 9).round(4)
+        item.bone_count = bone_count
+        item.bones = bin_ops.make_bones(bone_names, values)
+
+        item.location = tuple(single(-10, 10) for _ in range(3))
+        item.accessories = [make_string(f"acc{k}", string_length) for k in range(accessory_count)]
+        item.secondary_accessories = [make_string(f"sacc{k}", string_length) for k in range(secondary_accessory_count)]
+        item.glow_colors = tuple(rounded(2, 0, 1) for _ in range(6))
+        document.items.append(item)
+
+    document.camera = SceneCamera(single(0.5, 1.5), tuple(single(-5, 5) for _ in range(3)), single(1, 20), single(-3, 3), single(-1.5, 1.5))
+
+    for i in range(1, 4):
+        direction = tuple(rounded(6) for _ in range(3))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        document.lights.append(SceneLight(i, direction, rounded(2, 0, 2), color, rounded(2, 0, 1)))
+
+    use_post_processing = 1 if version > (1, 21) else None
+    document.post_processing = PostProcessing(use_post_processing, single(0, 2), single(0, 2), single(0, 2), single(0, 2))
+
+    background = Background(1, make_string("data\\ground", string_length))
+    background.color = tuple(rng.randrange(256) for _ in range(3))
+    background.texture_path = make_string("data\\background", string_length)
+    if version > (1, 21):
+        background.texture_type = "Fit"
+        background.hud_texture_path = make_string("data\\hud", string_length)
+    document.background = background
+
+    document.sky_dome = SkyDome(1, make_string("skydome", string_length), single(0, 6), single(-1, 1))
+    document.window_size = WindowSize(0, 1920, 1080)
+    return document
+
+
+def make_string(prefix, length):
+    # Pads or cuts the string to exactly the given length
+    return (prefix + "_" * length)[:length]
+
+
+def write_document(document: SceneDocument) -> bytes:
+    # Writes the document in the same order as the parser reads it.
+    # Empty strings are not allowed, because the parser can't tell a following "01" byte apart from the string length edge case
+    version = document.version
+    data = bytearray()
+    data += bin_ops.writeUInt16(version[0])
+    data += bin_ops.writeUInt16(version[1])
+
+    # Items
+    data += bin_ops.writeUInt32(len(document.items))
+    for item in document.items:
+        data += bin_ops.writeStringWithLength(item.name)
+        data += bin_ops.writeStringWithLength(item.path)
+        data += bin_ops.writeByte(item.visibility)
+        for value in item.scale:
+            data += bin_ops.writeSingle(value)
+
+        data += bin_ops.writeUInt32(len(item.bones))
+        values = np.concatenate([item.bones['rot'], item.bones['loc'], item.bones['scale']], axis=1).astype(np.float32)
+        for name, bone_values in zip(item.bones['name'], values):
+            data += bin_ops.writeStringWithLength(name)
+            data += bone_values.astype('<f4').tobytes()
+
+        for value in item.location:
+            data += bin_ops.writeSingle(value)
+
+        data += bin_ops.writeUInt32(len(item.accessories))
+        for name in item.accessories:
+            data += bin_ops.writeStringWithLength(name)
+            data += bin_ops.writeByte(1)
+        data += bin_ops.writeUInt16(len(item.secondary_accessories))
+        for name in item.secondary_accessories:
+            data += bin_ops.writeStringWithLength(name)
+            data += bin_ops.writeByte(1)
+
+        for value in item.glow_colors:
+            data += bin_ops.writeSingle(value)
+
+    # Camera
+    camera = document.camera
+    data += bin_ops.writeSingle(camera.fov)
+    for value in camera.target:
+        data += bin_ops.writeSingle(value)
+    data += bin_ops.writeSingle(camera.distance)
+    data += bin_ops.writeSingle(camera.rotation_horizontal)
+    data += bin_ops.writeSingle(camera.rotation_vertical)
+
+    # Lights
+    data += bin_ops.writeSingle(0)
+    for light in document.lights:
+        if version >= (1, 30) and light.index != 1:
+            data += bin_ops.writeByte(0)
+        for value in light.direction:
+            data += bin_ops.writeSingle(value)
+        data += bin_ops.writeSingle(light.intensity)
+        for value in light.color:
+            data += bin_ops.writeByte(value)
+        data += bin_ops.writeSingle(light.shadow_depth)
+
+    # Post processing
+    post_processing = document.post_processing
+    if version > (1, 21):
+        data += bin_ops.writeByte(post_processing.enabled)
+    data += bin_ops.writeSingle(post_processing.brightness)
+    data += bin_ops.writeSingle(post_processing.gamma)
+    data += bin_ops.writeSingle(post_processing.contrast)
+    data += bin_ops.writeSingle(post_processing.saturation)
+    data += bin_ops.writeByte(0)
+    if version > (1, 21):
+        data += bin_ops.writeSingle(0)
+
+    # Background
+    background = document.background
+    data += bin_ops.writeByte(background.ground_visibility)
+    data += bin_ops.writeStringWithLength(background.ground_texture_path)
+    for value in background.color:
+        data += bin_ops.writeByte(value)
+    data += bin_ops.writeStringWithLength(background.texture_path)
+    if version > (1, 21):
+        data += bin_ops.writeStringWithLength(background.texture_type)
+        data += bin_ops.writeStringWithLength(background.hud_texture_path)
+
+    # Sky dome
+    sky_dome = document.sky_dome
+    data += bin_ops.writeByte(sky_dome.visible)
+    data += bin_ops.writeStringWithLength(sky_dome.type)
+    data += bin_ops.writeSingle(sky_dome.rotation)
+    data += bin_ops.writeSingle(sky_dome.elevation)
+
+    # Window size
+    window_size = document.window_size
+    data += bin_ops.writeByte(window_size.is_maximized)
+    data += bin_ops.writeUInt32(window_size.width)
+    data += bin_ops.writeUInt32(window_size.height)
+
+    return bytes(data)
+
+
+def write_scene(filepath, **kwargs) -> SceneDocument:
+    # Generates a scene with the given settings (see create_document) and saves it to the given path
+    document = create_document(filepath=str(filepath), **kwargs)
+    with open(filepath, "wb") as f:
+        f.write(write_document(document))
+    return document
+
+
+def compare_documents(expected: SceneDocument, parsed: SceneDocument):
+    # Returns a list of all differences between the generated and the parsed document
+    errors = []
+
+    def compare(name, a, b):
+        if isinstance(a, (tuple, list)) and isinstance(b, (tuple, list)):
+            if len(a) != len(b) or any(x != y for x, y in zip(a, b)):
+                errors.append(f"{name}: expected {a}, got {b}")
+        elif a != b:
+            errors.append(f"{name}: expected {a}, got {b}")
+
+    compare("version", expected.version, parsed.version)
+    compare("item count", len(expected.items), len(parsed.items))
+    for item, item_parsed in zip(expected.items, parsed.items):
+        for attr in ('name', 'path', 'visibility', 'scale', 'bone_count', 'location', 'accessories', 'secondary_accessories', 'glow_colors'):
+            compare(f"item {item.index} {attr}", getattr(item, attr), getattr(item_parsed, attr))
+        if item_parsed.bones is None:
+            # Parsed without bones
+            continue
+        compare(f"item {item.index} bone names", list(item.bones['name']), list(item_parsed.bones['name']))
+        for field in ('rot', 'loc', 'scale'):
+            if not np.array_equal(item.bones[field], item_parsed.bones[field]):
+                errors.append(f"item {item.index} bone {field} values differ")
+
+    for obj_name in ('camera', 'post_processing', 'background', 'sky_dome', 'window_size'):
+        obj, obj_parsed = getattr(expected, obj_name), getattr(parsed, obj_name)
+        for attr in obj.__slots__:
+            compare(f"{obj_name} {attr}", getattr(obj, attr), getattr(obj_parsed, attr))
+
+    compare("light count", len(expected.lights), len(parsed.lights))
+    for light, light_parsed in zip(expected.lights, parsed.lights):
+        for attr in light.__slots__:
+            compare(f"light {light.index} {attr}", getattr(light, attr), getattr(light_parsed, attr))
+
+    return errors
@@ -0,0 +1,127 @@
+import bpy
+from contextlib import contextmanager
+
+from . import instrumentation
+
+# Deferred scene construction.
+# Every parent change triggers a rebuild of the dependency graph relations and every hide_set a resync of the view layer.
+# Inside of a build transaction these changes, object transforms and poses are only queued and applied all at once at the end,
+# so the dependency graph is not evaluated again after every item, e.g. by the XPS importer operator.
+
+
+class ImmediateTransaction:
+    # Applies every change right away, used outside of build transactions
+    active = False
+
+    def set(self, obj, prop, value):
+        setattr(obj, prop, value)
+
+    def set_parent(self, obj, parent):
+        obj.parent = parent
+
+    def set_hide(self, obj, hide, hide_render=None):
+        _apply_hide(obj, hide, hide_render)
+
+    def apply_pose(self, applier, bones, from_rest=False):
+        _apply_pose(applier, bones, from_rest)
+
+    def discard(self, obj):
+        pass
+
+
+class BuildTransaction:
+    active = True
+
+    def __init__(self):
+        # Object pointer -> object, and the queued changes by object pointer. Later changes of the same property replace earlier ones
+        self.objects = {}
+        self.parents = {}
+        self.properties = {}
+        self.visibility = {}
+        self.poses = []
+
+    def _add(self, obj):
+        key = obj.as_pointer()
+        self.objects[key] = obj
+        return key
+
+    def set(self, obj, prop, value):
+        self.properties.setdefault(self._add(obj), {})[prop] = value
+
+    def set_parent(self, obj, parent):
+        self.parents[self._add(obj)] = parent
+
+    def set_hide(self, obj, hide, hide_render=None):
+        self.visibility[self._add(obj)] = (hide, hide_render)
+
+    def apply_pose(self, applier, bones, from_rest=False):
+        self.poses.append((applier, bones, from_rest))
+
+    def discard(self, obj):
+        # Drops all queued changes of an object before it gets deleted
+        key = obj.as_pointer()
+        self.objects.pop(key, None)
+        self.parents.pop(key, None)
+        self.properties.pop(key, None)
+        self.visibility.pop(key, None)
+        self.parents = {k: parent for k, parent in self.parents.items() if parent is None or parent.as_pointer() != key}
+        self.poses = [pose for pose in self.poses if pose[0].armature.as_pointer() != key]
+
+    def commit(self, view_layer=None):
+        # Applies everything in one go: parents first, then transforms and poses, then visibility, followed by a single view layer update
+        timer = instrumentation.current.timer
+        with timer("apply parents"):
+            for key, parent in self.parents.items():
+                self.objects[key].parent = parent
+        with timer("apply transforms"):
+            for key, properties in self.properties.items():
+                obj = self.objects[key]
+                for prop, value in properties.items():
+                    setattr(obj, prop, value)
+        with timer("apply poses"):
+            for applier, bones, from_rest in self.poses:
+                _apply_pose(applier, bones, from_rest)
+        with timer("apply visibility"):
+            for key, (hide, hide_render) in self.visibility.items():
+                _apply_hide(self.objects[key], hide, hide_render)
+
+        with timer("view layer update"):
+            (view_layer or bpy.context.view_layer).update()
+        instrumentation.current.count("deferred_changes", len(self.parents) + len(self.properties) + len(self.poses) + len(self.visibility))
+
+        self.__init__()
+
+
+def _apply_hide(obj, hide, hide_render=None):
+    if hide_render is None:
+        hide_render = hide
+
+    if obj.hide_get() != hide:
+        obj.hide_set(hide)
+    if obj.hide_render != hide_render:
+        obj.hide_render = hide_render
+
+
+def _apply_pose(applier, bones, from_rest):
+    posed_count, missing_count = applier.apply(bones, from_rest)
+    instrumentation.current.count("bones_posed", posed_count)
+    instrumentation.current.count("bones_missing", missing_count)
+
+
+IMMEDIATE = ImmediateTransaction()
+current = IMMEDIATE
+
+
+@contextmanager
+def build(view_layer=None):
+    # Queues all changes made through transaction.current during the with-block and applies them when it ends.
+    # If the block raises, the queued changes are dropped, so a half-built scene isn't applied and the original error is kept
+    global current
+    previous = current
+    transaction = BuildTransaction()
+    current = transaction
+    try:
+        yield transaction
+    finally:
+        current = previous
+    transaction.commit(view_layer)
@@ -1,22 +1,26 @@
 
 import os
 import bpy
-import math
 import time
 import pathlib
 import mathutils
 import addon_utils
-import numpy as np
 from mathutils import Vector, Euler
-from threading import Thread
-from math import radians
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 
-from bpy.types import LayerCollection
+from . import instrumentation
+from . import logger
+from . import transaction
+from .asset_index import AssetIndex
+
+log = logger.get_logger("utils")
 
 
 main_dir = pathlib.Path(__file__).parent
 resources_dir = main_dir / "resources"
 settings_file = resources_dir / "settings.json"
+asset_index_file = resources_dir / "asset_index.json"
 if not resources_dir.exists():
     resources_dir.mkdir()
 
@@ -35,13 +39,8 @@ def set_select(obj, select):
 
 
 def set_hide(obj, hide, hide_render=None):
-    if hide_render is None:
-        hide_render = hide
-
-    if obj.hide_get() != hide:
-        obj.hide_set(hide)
-    if obj.hide_render != hide_render:
-        obj.hide_render = hide_render
+    # Deferred until the end of the build transaction, if there is one
+    transaction.current.set_hide(obj, hide, hide_render)
 
 
 # Recursively traverse layer_collection for a particular name
@@ -52,6 +51,11 @@ def find_layer_collection(name: str, layer_collection=None):
     if layer_collection.name == name:
         return layer_collection
 
+    # XPS scene collections are direct children of the scene collection, so check the children by name before walking the whole tree
+    found = layer_collection.children.get(name)
+    if found:
+        return found
+
     for layer in layer_collection.children:
         found = find_layer_collection(name, layer)
         if found:
@@ -59,14 +63,62 @@ def find_layer_collection(name: str, layer_collection=None):
     return None
 
 
-def delete_hierarchy(layer_collection: LayerCollection):
-    for obj in layer_collection.collection.objects:
-        bpy.data.objects.remove(obj, do_unlink=True)
-
-    for child in layer_collection.children:
-        delete_hierarchy(child)
-
-    bpy.data.collections.remove(layer_collection.collection, do_unlink=True)
+def delete_hierarchy(collection: bpy.types.Collection):
+    # Deletes the collection with all child collections and objects, and all data that only they use, in a single batch_remove call.
+    # Removing the objects one by one remaps the whole file for every object
+    collections = [collection] + list(collection.children_recursive)
+    return remove_with_data(list(collection.all_objects) + collections)
+
+
+def remove_with_data(ids):
+    # Removes the given datablocks and the data that is used exclusively by them. Returns the number of removed datablocks
+    ids = list({id_data.as_pointer(): id_data for id_data in ids}.values())
+    removed = ids + get_exclusive_data(ids)
+    bpy.data.batch_remove(removed)
+    instrumentation.current.count("datablocks_removed", len(removed))
+    return len(removed)
+
+
+# Data types that are removed together with the objects that use them
+EXCLUSIVE_DATA_TYPES = (bpy.types.Mesh, bpy.types.Armature, bpy.types.Material, bpy.types.Image, bpy.types.Light, bpy.types.Camera)
+
+
+def _get_used_data(id_data):
+    # Returns the datablocks that are directly used by this datablock and could be removed together with it
+    if isinstance(id_data, bpy.types.Object):
+        used = [id_data.data] if id_data.data else []
+        return used + [slot.material for slot in id_data.material_slots if slot.link == 'OBJECT' and slot.material]
+    if isinstance(id_data, bpy.types.Mesh):
+        return [material for material in id_data.materials if material]
+    if isinstance(id_data, bpy.types.Material) and id_data.node_tree:
+        return [node.image for node in id_data.node_tree.nodes if node.type == 'TEX_IMAGE' and node.image]
+    return []
+
+
+def get_exclusive_data(ids):
+    # Returns the object data, materials and images that are only used by the given datablocks.
+    # This goes down one level at a time (objects -> meshes -> materials -> images), so all users of a level are known before it is checked.
+    # bpy.data.user_map scans the whole file once per level, instead of once per removed object
+    owners = set(ids)
+    exclusive = []
+    candidates = {used for id_data in ids for used in _get_used_data(id_data)}
+    while candidates:
+        candidates = {c for c in candidates if isinstance(c, EXCLUSIVE_DATA_TYPES) and not c.use_fake_user and not c.library and c not in owners}
+        if not candidates:
+            break
+
+        next_candidates = set()
+        for id_data, users in bpy.data.user_map(subset=candidates).items():
+            if not users <= owners:
+                continue
+            exclusive.append(id_data)
+            next_candidates.update(_get_used_data(id_data))
+        owners.update(exclusive)
+
+        # Node trees of materials are embedded, depending on the Blender version they are listed as users of the images
+        owners.update(material.node_tree for material in exclusive if isinstance(material, bpy.types.Material) and material.node_tree)
+        candidates = next_candidates
+    return exclusive
 
 
 def create_empty(link_collection=None):
@@ -90,52 +142,90 @@ def look_at_2(obj, location, keep_empty=False):
         return empty_target
 
 
-def look_at(obj: bpy.types.Object, target: mathutils.Vector):
+def look_at(obj: bpy.types.Object, target: mathutils.Vector, location: mathutils.Vector = None):
     """ Rotate the object to look at a target point """
-    direction = target - obj.location
+    # Pass the location if it was just set in a build transaction, since obj.location doesn't have it yet
+    if location is None:
+        location = obj.location
+    direction = target - location
     q = direction.to_track_quat("-Z", "Y")
 
-    obj.rotation_euler = q.to_euler()
-
+    transaction.current.set(obj, "rotation_euler", q.to_euler())
 
-def rotate(vector, rot):
-    vector = np.asarray(vector)
-    rot = np.asarray(rot)
-    rot = np.radians(rot)
-    x, y, z = rot
 
-    Rx = np.array(([
-        [1, 0, 0],
-        [0, math.cos(x), -math.sin(x)],
-        [0, math.sin(x), math.cos(x)]
-    ]))
-    Ry = np.array(([
-        [math.cos(y), 0, math.sin(y)],
-        [0, 1, 0],
-        [-math.sin(y), 0, math.cos(y)]
-    ]))
-    Rz = np.array(([
-        [math.cos(z), -math.sin(z), 0],
-        [math.sin(z), math.cos(z), 0],
-        [0, 0, 1]
-    ]))
-
-    return Rx @ Ry @ Rz @ vector
+# Module name of the XPS importer addon once it was found.
+# addon_utils.modules() reads the bl_info of every installed addon, so it is only searched again while the importer is missing
+xps_importer_module = None
 
 
 def check_for_xps_importer():
+    global xps_importer_module
+    if xps_importer_module is None:
+        for mod in addon_utils.modules():
+            if mod.bl_info['name'] == "XNALara/XPS Import/Export":
+                # if mod.bl_info['version'] < (2, 0, 2):
+                #     continue
+                xps_importer_module = mod.__name__
+                break
+        else:
+            return False
+
     # then enable correct version
-    for mod in addon_utils.modules():
-        if mod.bl_info['name'] == "XNALara/XPS Import/Export":
-            # if mod.bl_info['version'] < (2, 0, 2):
-            #     continue
-            if not addon_utils.check(mod.__name__)[0]:
-                bpy.ops.preferences.addon_enable(module=mod.__name__)
-            return True
-    return False
+    if not addon_utils.check(xps_importer_module)[0]:
+        try:
+            bpy.ops.preferences.addon_enable(module=xps_importer_module)
+        except RuntimeError:
+            pass
+        if not addon_utils.check(xps_importer_module)[1]:
+            # The importer was uninstalled or can't be enabled anymore, search it again next time
+            log.warning("Could not enable the XPS importer '%s'", xps_importer_module)
+            xps_importer_module = None
+            return False
+    return True
+
+
+# Datablock types that an import creates, these are counted and purged by the low memory mode
+DATABLOCK_TYPES = ("objects", "meshes", "armatures", "materials", "images", "textures", "node_groups", "lights", "cameras", "collections", "actions")
+
+
+def get_datablock_counts():
+    return {name: len(getattr(bpy.data, name)) for name in DATABLOCK_TYPES}
+
+
+def get_datablock_pointers():
+    return {id_data.as_pointer() for name in DATABLOCK_TYPES for id_data in getattr(bpy.data, name)}
+
+
+def purge_new_orphans(existing_pointers):
+    # Removes all datablocks without users that didn't exist before and returns how many were removed.
+    # Removing a mesh can leave its materials without users, so this repeats until no new orphans are left
+    removed = 0
+    while True:
+        orphans = [id_data for name in DATABLOCK_TYPES for id_data in getattr(bpy.data, name)
+                   if id_data.users == 0 and not id_data.use_fake_user and id_data.as_pointer() not in existing_pointers]
+        if not orphans:
+            return removed
+        bpy.data.batch_remove(orphans)
+        removed += len(orphans)
+
+
+def suspend_global_undo():
+    # Turns off global undo, so no undo step keeps a second copy of all the imported data. Returns whether it was enabled
+    edit = bpy.context.preferences.edit
+    enabled = edit.use_global_undo
+    edit.use_global_undo = False
+    return enabled
+
+
+def resume_global_undo():
+    # Turns global undo back on. The calling operator must not have the UNDO option, it pushes its single undo step itself afterwards
+    bpy.context.preferences.edit.use_global_undo = True
 
 
 def update_viewport():
+    # Redrawing evaluates the dependency graph, which a build transaction defers until it's done
+    if transaction.current.active:
+        return
     try:
         bpy.ops.wm.redraw_timer(type='DRAW_WIN_SWAP', iterations=1)
     except:
@@ -181,8 +271,7 @@ def move_bone_global(bone, loc: Vector):
 def xps_bone_rotate(bone, rot_delta):
     current_rotation_mode = bone.rotation_mode
     bone.rotation_mode = 'QUATERNION'
-    rotation = vector_transform(rot_delta)
-    eulerRot = xps_rot_to_euler(rotation)
+    eulerRot = xps_rot_to_euler(rot_delta)
     origRot = bone.bone.matrix_local.to_quaternion()  # LOCAL EditBone
 
     rotation = eulerRot.to_quaternion()
@@ -202,37 +291,26 @@ def xps_bone_scale(bone, scale):
     bone.scale = newScale
 
 
+# The conversions are done by the conversion module, which is imported on first use since it loads numpy
+
 def xps_rot_to_euler(rot_delta):
-    xRad = radians(rot_delta.x)
-    yRad = radians(rot_delta.y)
-    zRad = radians(rot_delta.z)
-    return Euler((xRad, yRad, zRad), 'YXZ')
+    from . import conversion
+    return Euler(conversion.rotation_to_blender(rot_delta), conversion.ROTATION_ORDER)
 
 
 def vector_transform(vec):
-    x = vec.x
-    y = vec.y
-    z = vec.z
-    z = -z
-    newVec = Vector((x, z, y))
-    return newVec
+    from . import conversion
+    return Vector(conversion.location_to_blender(vec))
 
 
 def vector_transform_translate(vec):
-    x = vec.x
-    y = vec.y
-    z = vec.z
-    z = -z
-    newVec = Vector((x, z, y))
-    return newVec
+    from . import conversion
+    return Vector(conversion.location_to_blender(vec))
 
 
 def vector_transform_scale(vec):
-    x = vec.x
-    y = vec.y
-    z = vec.z
-    newVec = Vector((x, y, z))
-    return newVec
+    # Bone scales are applied as they are
+    return Vector(vec)
 
 
 def create_ground_material(image: bpy.types.Image):
@@ -256,27 +334,34 @@ def create_ground_material(image: bpy.types.Image):
 
 def search_dir_for_file(path: pathlib.Path, file_name: str):
     # Search in the folder for the file name + ".mesh" or ".xps" or ".ascii"
+    instrumentation.current.count("fs_probes")
     for file in path.iterdir():
         if file.suffix in [".mesh", ".xps", ".ascii"]:
             if file.stem.lower() == file_name.lower():
                 return file
 
-    print(f"Character folder '{path}' does not contain the file {file_name} (.xps, .mesh, .ascii), continuing search..")
+    log.debug("Character folder '%s' does not contain the file %s (.xps, .mesh, .ascii), continuing search..", path, file_name)
+
 
+def search_dirs_for_model(filepath, filename, install_dir=None, asset_dir=None):
+    # The directories have to be passed in when this is not called from the main thread
+    if install_dir is None:
+        install_dir = bpy.context.scene.xps_importer_install_dir
+    if asset_dir is None:
+        asset_dir = bpy.context.scene.xps_importer_asset_dir
 
-def search_dirs_for_model(filepath, filename):
     # Turn windows path into a path independent on os
     filepath_split = filepath.split("\\")
 
-    has_install_dir = bool(bpy.context.scene.xps_importer_install_dir)
-    has_asset_dir = bool(bpy.context.scene.xps_importer_asset_dir)
+    has_install_dir = bool(install_dir)
+    has_asset_dir = bool(asset_dir)
 
     # Create paths
     folder = pathlib.Path(*filepath_split)
-    folder_installation = pathlib.Path(bpy.context.scene.xps_importer_install_dir)
-    folder_assets = pathlib.Path(bpy.context.scene.xps_importer_asset_dir)
+    folder_installation = pathlib.Path(install_dir)
+    folder_assets = pathlib.Path(asset_dir)
 
-    print(f"\nStarting search for character '{folder.name}/{filename}.mesh/.xps/.ascii'")
+    log.debug("Starting search for character '%s/%s.mesh/.xps/.ascii'", folder.name, filename)
 
     # Create a list of all the possible folders
     folders = [filepath]
@@ -293,7 +378,7 @@ def search_dirs_for_model(filepath, filename):
     character_folder = None
     mesh_file = None
     for f in folders:
-        # print(f"Checking folder '{f}', exists: {os.path.isdir(str(f))}")
+        instrumentation.current.count("fs_probes")
         if os.path.isdir(str(f)):
             character_folder = pathlib.Path(str(f))
             mesh_file = search_dir_for_file(character_folder, filename)
@@ -301,37 +386,90 @@ def search_dirs_for_model(filepath, filename):
                 break
 
     # If the character folder was not found, search the full asset dir for it
-    max_folder_depth = 5
     if not character_folder and has_asset_dir and folder_assets.exists():
-        # Get all folders in the asset dir
-        # TODO: Make this yield the folders instead of creating a list
-        folders_all = listdir_r(folder_assets, max_depth=max_folder_depth)
-        for f in folders_all:
-            # print(f"Checking folder '{f}'")
-            if f.name == folder.name:
-                # print(f"FOUND!")
-                character_folder = f
-                mesh_file = search_dir_for_file(character_folder, filename)
-                if mesh_file:
-                    break
+        index = get_asset_index(folder_assets)
+        character_folder, mesh_file = search_asset_index(index, folder.name, filename)
+
+        # The index might be outdated, so refresh it and try again
+        if not mesh_file:
+            refresh_asset_index_if_outdated(index)
+            character_folder, mesh_file = search_asset_index(index, folder.name, filename)
 
     return character_folder, mesh_file
 
 
-def run_func_after_blender_startup(func):
+def resolve_models(models, max_workers=8):
+    # Searches all (filepath, filename) pairs concurrently, each distinct pair is only searched once.
+    # Returns a dict mapping each pair to its (character_folder, mesh_file)
+    install_dir = bpy.context.scene.xps_importer_install_dir
+    asset_dir = bpy.context.scene.xps_importer_asset_dir
+
+    models = list(dict.fromkeys(models))
+    if not models:
+        return {}
+
+    def search(model):
+        start = time.perf_counter()
+        result = search_dirs_for_model(*model, install_dir=install_dir, asset_dir=asset_dir)
+        return result, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(models))) as executor:
+        results = list(executor.map(search, models))
+
+    # Record the search time of each model below the current timer
+    for (filepath, filename), (_, seconds) in zip(models, results):
+        folder_name = filepath.split("\\")[-1]
+        instrumentation.current.add_time((f"{folder_name}/{filename}",), seconds)
+
+    return {model: result for model, (result, _) in zip(models, results)}
+
 
-    def wait_for_scene_load():
-        while True:
-            print("Has scene?")
-            if hasattr(bpy.context, "scene"):
-                print("YES")
-                func()
-                return
-            print("NO")
-            time.sleep(0.1)
-
-    thread = Thread(target=wait_for_scene_load, args=[])
-    thread.start()
+_asset_index: AssetIndex = None
+_asset_index_lock = Lock()
+asset_index_refresh_interval = 60  # Seconds
+
+
+def get_asset_index(asset_dir: pathlib.Path, refresh=True) -> AssetIndex:
+    # Load the asset index once, it is updated incrementally afterwards
+    global _asset_index
+    with _asset_index_lock:
+        if not _asset_index or _asset_index.root != pathlib.Path(asset_dir):
+            _asset_index = AssetIndex(asset_dir, asset_index_file)
+            _asset_index.load()
+            if refresh:
+                _asset_index.refresh()
+        return _asset_index
+
+
+def refresh_asset_index_if_outdated(index: AssetIndex):
+    # Only one search refreshes the index, concurrent searches wait for it and then use the refreshed index
+    with _asset_index_lock:
+        if time.time() - index.last_refresh > asset_index_refresh_interval:
+            index.refresh()
+
+
+def search_asset_index(index: AssetIndex, folder_name: str, filename: str):
+    character_folder = None
+    for folder in index.find_folders(folder_name):
+        character_folder = folder
+        mesh_file = index.find_mesh_in_folder(folder, filename)
+        if mesh_file:
+            instrumentation.current.count("fs_probes")
+        if mesh_file and mesh_file.exists():
+            return character_folder, mesh_file
+    return character_folder, None
+
+
+def run_func_after_blender_startup(func):
+    # Timers only run on the main thread once Blender finished starting, so there is no need to wait in a thread.
+    # If the scene is still not available, the timer tries again a bit later
+    def run():
+        if not hasattr(bpy.context, "scene"):
+            return 0.1
+        func()
+        return None
+
+    bpy.app.timers.register(run, first_interval=0)
 
 
 # def cartesian_to_spherical(x, y, z):